@@ -5,39 +5,150 @@ This module provides utilities for parsing HL7 v2 messages and extracting
 field values based on segment.field.component notation.
 """
 
-from typing import Dict, List, Optional, Any
+import asyncio
+import collections
+import functools
+import mmap
+import os
+import re
+import sys
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import DefaultDict, Dict, FrozenSet, Iterable, Iterator, List, Optional, OrderedDict, Pattern, Tuple, Union, Any
 from datetime import datetime
 
 
+# HL7 segments end in CR, LF or CRLF. str.splitlines() is not used because it also breaks
+# on \x0b, \x0c, \x1c-\x1e, \x85, \u2028 and \u2029, which may appear inside field values.
+_SEGMENT_TERMINATOR = re.compile(r'\r\n|\r|\n')
+
+
+@functools.lru_cache(maxsize=64)
+def _segment_line_pattern(wanted: Optional[FrozenSet[str]]) -> Pattern[bytes]:
+    """
+    Compile a pattern matching whole CR/LF-delimited segment lines in a byte buffer.
+    
+    With wanted, only lines starting with one of those segment IDs (or MSH) match, so the
+    regex engine skips every other line without copying it out of the buffer.
+    """
+    if wanted is None:
+        return re.compile(rb'[^\r\n]+')
+    segment_ids = b'|'.join(re.escape(segment_type.encode('ascii')) for segment_type in sorted(wanted | {'MSH'}))
+    # Indented lines are matched too; _parse_message strips the leading blanks
+    return re.compile(rb'(?<![^\r\n])[ \t]*(?:' + segment_ids + rb')[^\r\n]*')
+
+
+def _strip_line(line: str) -> str:
+    """Strip surrounding whitespace, checking only the first and last characters for it."""
+    if line[:1].isspace() or line[-1:].isspace():
+        return line.strip()
+    return line
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_ref(field_reference: str) -> Optional[Tuple[str, int, Optional[int], Optional[int]]]:
+    """
+    Resolve a 'SEGMENT.FIELD[.COMPONENT[.SUBCOMPONENT]]' reference to
+    (segment_type, field_index, component_index, subcomponent_index).
+    
+    Trailing indexes are None when the reference stops above that level. References come
+    from the mapping config, so the cache stays small and hits almost every time.
+    """
+    parts = field_reference.split('.')
+    if len(parts) < 2:
+        return None
+    component_index = int(parts[2]) if len(parts) > 2 else None
+    subcomponent_index = int(parts[3]) if len(parts) > 3 else None
+    return parts[0], int(parts[1]), component_index, subcomponent_index
+
+
+@functools.lru_cache(maxsize=None)
+def _component_pattern(component_separator: str, subcomponent_separator: str) -> Pattern[str]:
+    """
+    Compile a pattern that splits a field on both component and subcomponent separators.
+    
+    Each separator gets its own capturing group, so re.split() returns
+    [token, component_sep, subcomponent_sep, token, ...] with exactly one of the
+    two separator slots set between tokens.
+    """
+    return re.compile(f"({re.escape(component_separator)})|({re.escape(subcomponent_separator)})")
+
+
 class HL7Field:
     """Represents an HL7 field with its components and repetitions."""
     
+    __slots__ = ('value', 'field_separator', '_components')
+    
     def __init__(self, value: str, field_separator: str = '^'):
         self.value = value
         self.field_separator = field_separator
-        self.components = self._parse_components()
+        self._components: Optional[List[str]] = None
     
-    def _parse_components(self) -> List[str]:
-        """Parse field components separated by the field separator."""
-        if not self.value:
-            return []
-        return self.value.split(self.field_separator)
+    @property
+    def components(self) -> List[str]:
+        """Field components separated by the field separator, split on first access."""
+        if self._components is None:
+            self._components = self.value.split(self.field_separator) if self.value else []
+        return self._components
     
     def get_component(self, index: int) -> Optional[str]:
         """Get component by 1-based index."""
         if index < 1 or index > len(self.components):
             return None
         return self.components[index - 1] if self.components[index - 1] else None
+    
+    def get_subcomponent(self, component_index: int, subcomponent_index: int,
+                         pattern: Optional[Pattern[str]] = None) -> Optional[str]:
+        """
+        Get subcomponent by 1-based component and subcomponent index.
+        
+        Args:
+            component_index: 1-based component index
+            subcomponent_index: 1-based subcomponent index within that component
+            pattern: Message-level split pattern from the message's encoding characters;
+                defaults to this field's separator and '&'
+        """
+        if not self.value or component_index < 1 or subcomponent_index < 1:
+            return None
+        if pattern is None:
+            pattern = _component_pattern(self.field_separator, '&')
+        
+        # One split walks the value once for both separator levels
+        tokens = pattern.split(self.value)
+        component, subcomponent = 1, 1
+        for i in range(0, len(tokens), 3):
+            if component == component_index and subcomponent == subcomponent_index:
+                return tokens[i] or None
+            if i + 1 < len(tokens):
+                if tokens[i + 1] is not None:
+                    component, subcomponent = component + 1, 1
+                else:
+                    subcomponent += 1
+            if component > component_index:
+                break
+        return None
 
 
 class HL7Segment:
     """Represents an HL7 segment with its fields."""
     
+    __slots__ = ('segment_line', 'field_separator', 'segment_type', '_fields', '_field_cache')
+    
     def __init__(self, segment_line: str, field_separator: str = '|'):
-        self.segment_line = segment_line.strip()
+        self.segment_line = _strip_line(segment_line)
         self.field_separator = field_separator
-        self.fields = self._parse_fields()
-        self.segment_type = self.fields[0] if self.fields else ""
+        # Only the segment ID is read up front (fields are split on first access); IDs
+        # repeat across every message, so interning makes them shared dict keys
+        self.segment_type = sys.intern(self.segment_line.partition(field_separator)[0])
+        self._fields: Optional[List[str]] = None
+        self._field_cache: Optional[List[Optional[HL7Field]]] = None
+    
+    @property
+    def fields(self) -> List[str]:
+        """Segment fields separated by the field separator, split on first access."""
+        if self._fields is None:
+            self._fields = self._parse_fields()
+        return self._fields
     
     def _parse_fields(self) -> List[str]:
         """Parse segment fields separated by the field separator."""
@@ -45,52 +156,109 @@ class HL7Segment:
     
     def get_field(self, index: int) -> Optional[HL7Field]:
         """Get field by 1-based index."""
-        if index < 1 or index > len(self.fields):
+        fields = self.fields
+        if index < 1 or index > len(fields):
             return None
-        field_value = self.fields[index - 1] if index <= len(self.fields) else ""
-        return HL7Field(field_value)
+        if self._field_cache is None:
+            self._field_cache = [None] * len(fields)
+        field = self._field_cache[index - 1]
+        if field is None:
+            field = HL7Field(fields[index - 1])
+            self._field_cache[index - 1] = field
+        return field
 
 
 class HL7Message:
     """Represents a complete HL7 message with all its segments."""
     
-    def __init__(self, message_text: str):
-        self.message_text = message_text
-        self.segments: Dict[str, List[HL7Segment]] = {}
+    __slots__ = ('message_text', 'segments', 'field_separator', 'component_separator',
+                 'repetition_separator', 'escape_character', 'subcomponent_separator',
+                 '_component_pattern', '_pending_segments')
+    
+    def __init__(self, message_text: str = "", lines: Optional[Iterable[str]] = None,
+                 wanted: Optional[Iterable[str]] = None, lazy: bool = False):
+        """
+        Parse a message from its full text or, incrementally, from an iterable of lines.
+        
+        Args:
+            message_text: Complete HL7 message text
+            lines: Segment lines to parse instead of message_text (e.g. streamed from a file).
+                The full text is never assembled, so `message_text` is then None.
+            wanted: Segment types to keep; others are skipped without being split.
+                MSH is always kept. None keeps every segment.
+            lazy: Keep non-MSH lines raw, grouped by segment type, and build their
+                segments on first get_segments() call. Until then a type is absent
+                from `segments`.
+        """
+        self.message_text: Optional[str] = message_text if lines is None else None
+        self.segments: DefaultDict[str, List[HL7Segment]] = collections.defaultdict(list)
         self.field_separator = '|'
         self.component_separator = '^'
         self.repetition_separator = '~'
         self.escape_character = '\\'
         self.subcomponent_separator = '&'
-        self._parse_message()
+        self._component_pattern = _component_pattern(self.component_separator, self.subcomponent_separator)
+        self._pending_segments: Dict[str, List[str]] = {}
+        self._parse_message(lines, frozenset(wanted) | {'MSH'} if wanted is not None else None, lazy)
     
-    def _parse_message(self) -> None:
+    def _parse_message(self, lines: Optional[Iterable[str]] = None,
+                       wanted: Optional[FrozenSet[str]] = None, lazy: bool = False) -> None:
         """Parse the complete HL7 message into segments."""
-        lines = [line.strip() for line in self.message_text.split('\n') if line.strip()]
+        # One regex split handles \r, \n and \r\n terminators; only lines that start or
+        # end with whitespace are stripped, so ordinary lines are never copied
+        if lines is None:
+            lines = _SEGMENT_TERMINATOR.split(self.message_text or "")
+        lines = (_strip_line(line) for line in lines)
+        field_separator = self.field_separator
+        segments = self.segments
+        if wanted is None:
+            line_iter = (line for line in lines if line)
+        else:
+            # Segment IDs are always three characters, so unwanted lines are dropped unsplit
+            line_iter = (line for line in lines if line[:3] in wanted)
         
-        for line in lines:
-            if not line:
-                continue
-                
-            segment = HL7Segment(line, self.field_separator)
-            segment_type = segment.segment_type
-            
-            if segment_type not in self.segments:
-                self.segments[segment_type] = []
-            
-            self.segments[segment_type].append(segment)
-            
-            # Extract encoding characters from MSH segment
-            if segment_type == 'MSH' and len(segment.fields) > 1:
-                encoding_chars = segment.fields[1]
-                if len(encoding_chars) >= 4:
-                    self.component_separator = encoding_chars[0]
-                    self.repetition_separator = encoding_chars[1]
-                    self.escape_character = encoding_chars[2]
-                    self.subcomponent_separator = encoding_chars[3]
+        # MSH is always the first segment, so encoding characters are read once up front
+        # and the loop below is a plain split-and-append
+        first_line = next(line_iter, None)
+        if first_line is None:
+            return
+        header = HL7Segment(first_line, field_separator)
+        segments[header.segment_type].append(header)
+        if header.segment_type == 'MSH':
+            self._set_encoding_characters(header)
+        
+        if lazy:
+            pending = self._pending_segments
+            for line in line_iter:
+                pending.setdefault(line.partition(field_separator)[0], []).append(line)
+            return
+        
+        # Bind the defaultdict lookup to a local to skip attribute lookups per line
+        group = segments.__getitem__
+        for segment in [HL7Segment(line, field_separator) for line in line_iter]:
+            group(segment.segment_type).append(segment)
+    
+    def _set_encoding_characters(self, msh: HL7Segment) -> None:
+        """Extract encoding characters from the MSH segment."""
+        if len(msh.fields) > 1:
+            encoding_chars = msh.fields[1]
+            if len(encoding_chars) >= 4:
+                self.component_separator = encoding_chars[0]
+                self.repetition_separator = encoding_chars[1]
+                self.escape_character = encoding_chars[2]
+                self.subcomponent_separator = encoding_chars[3]
+                self._component_pattern = _component_pattern(self.component_separator,
+                                                             self.subcomponent_separator)
     
     def get_segments(self, segment_type: str) -> List[HL7Segment]:
         """Get all segments of a specific type."""
+        # Pending lines are checked first: indexing the `segments` defaultdict may already
+        # have inserted an empty list for this type, which is filled in place
+        pending = self._pending_segments.pop(segment_type, None)
+        if pending is not None:
+            segments = self.segments[segment_type]
+            segments.extend(HL7Segment(line, self.field_separator) for line in pending)
+            return segments
         return self.segments.get(segment_type, [])
     
     def get_segment(self, segment_type: str, index: int = 0) -> Optional[HL7Segment]:
@@ -105,31 +273,34 @@ class HL7Message:
         Get field value using HL7 field reference notation (e.g., 'PID.5.1').
         
         Args:
-            field_reference: Field reference in format 'SEGMENT.FIELD.COMPONENT'
+            field_reference: Field reference in format 'SEGMENT.FIELD.COMPONENT[.SUBCOMPONENT]'
         
         Returns:
             Field value as string or None if not found
         """
-        parts = field_reference.split('.')
-        if len(parts) < 2:
+        parsed_ref = _parse_ref(field_reference)
+        if parsed_ref is None:
             return None
         
-        segment_type = parts[0]
-        field_index = int(parts[1])
-        component_index = int(parts[2]) if len(parts) > 2 else 1
+        segment_type, field_index, component_index, subcomponent_index = parsed_ref
         
         segment = self.get_segment(segment_type)
         if not segment:
             return None
         
+        if component_index is None:
+            # Whole-field references read the raw value; no HL7Field or component split needed
+            if field_index < 1 or field_index > len(segment.fields):
+                return None
+            return segment.fields[field_index - 1]
+        
         field = segment.get_field(field_index)
         if not field:
             return None
         
-        if len(parts) > 2:
-            return field.get_component(component_index)
-        else:
-            return field.value
+        if subcomponent_index is not None:
+            return field.get_subcomponent(component_index, subcomponent_index, self._component_pattern)
+        return field.get_component(component_index)
     
     def get_all_segments_values(self, segment_type: str) -> List[Dict[str, Any]]:
         """Get all segments of a type as a list of dictionaries."""
@@ -144,55 +315,250 @@ class HL7Message:
             result.append(segment_data)
         
         return result
+    
+    def get_segments_columnar(self, segment_type: str) -> Dict[int, List[str]]:
+        """
+        Get all segments of a type as columns keyed by 0-based field index.
+        
+        Each column holds that field's value for every segment, padded with '' for
+        segments with fewer fields, so repeated segments (e.g. OBX) can be read field-wise.
+        """
+        segments = self.get_segments(segment_type)
+        if not segments:
+            return {}
+        
+        max_width = max(len(segment.fields) for segment in segments)
+        return {
+            i: [segment.fields[i] if i < len(segment.fields) else '' for segment in segments]
+            for i in range(max_width)
+        }
+
+
+@dataclass(slots=True)
+class OBXRow:
+    """A single OBX observation result, read by fixed field position."""
+    
+    set_id: int
+    identifier: str
+    name: str
+    value: str
+    units: str
+    flags: str
+
+
+class HL7ValidationError(IntEnum):
+    """Structural problem reported by HL7Parser.validate_message; str() gives the message."""
+    
+    MISSING_MSH = 1
+    MISSING_PID = 2
+    
+    def __str__(self) -> str:
+        return _VALIDATION_MESSAGES[self]
+
+
+_VALIDATION_MESSAGES: Dict[HL7ValidationError, str] = {
+    HL7ValidationError.MISSING_MSH: "Missing required MSH segment",
+    HL7ValidationError.MISSING_PID: "Missing required PID segment for ADT message",
+}
+
+
+# Fixed-width HL7 date formats: input_format -> (width, ISO output template). Inputs are
+# sliced into year, month, day, hour and minute parts, as far as the width reaches.
+_DATE_FORMATS: Dict[str, Tuple[int, str]] = {
+    "YYYYMMDD": (8, "{}-{}-{}"),
+    "YYYYMMDDHHMM": (12, "{}-{}-{} {}:{}"),
+}
+_DATE_PART_SLICES = ((0, 4), (4, 6), (6, 8), (8, 10), (10, 12))
+
+
+# Parsed messages keyed by (absolute path, st_mtime_ns, st_size), so re-running a
+# transformation over unchanged input files skips parsing. Each entry also records
+# the wanted segment set it was parsed with (None = all segments).
+_PARSE_CACHE_MAXSIZE = 64
+_PARSE_CACHE: OrderedDict[Tuple[str, int, int], Tuple[Optional[FrozenSet[str]], HL7Message]] = \
+    collections.OrderedDict()
 
 
 class HL7Parser:
     """Main parser class for HL7 messages."""
     
     @staticmethod
-    def parse(message_text: str) -> HL7Message:
-        """Parse an HL7 message from text."""
-        return HL7Message(message_text)
+    def parse(message_text: Union[str, bytes], wanted: Optional[Iterable[str]] = None) -> HL7Message:
+        """
+        Parse an HL7 message from text or raw bytes, optionally keeping only the wanted segment types.
+        
+        Bytes go through parse_from_bytes, so lines are filtered before they are decoded
+        and the message's `message_text` is None.
+        """
+        if isinstance(message_text, (bytes, bytearray)):
+            return HL7Parser.parse_from_bytes(message_text, wanted)
+        return HL7Message(message_text, wanted=wanted)
     
     @staticmethod
-    def parse_from_file(file_path: str) -> HL7Message:
-        """Parse an HL7 message from a file."""
-        with open(file_path, 'r', encoding='utf-8') as file:
-            return HL7Parser.parse(file.read())
+    def parse_lazy(message_text: str) -> HL7Message:
+        """
+        Parse an HL7 message, deferring segment construction until each type is requested.
+        
+        Only MSH is built up front; other lines are indexed by segment type, so types
+        never passed to get_segments() cost one partition per line.
+        """
+        return HL7Message(message_text, lazy=True)
     
     @staticmethod
+    def parse_from_file(file_path: str, wanted: Optional[Iterable[str]] = None) -> HL7Message:
+        """
+        Parse an HL7 message from a file, streaming segments from a memory map.
+        
+        The file's text is never held whole, so the message's `message_text` is None.
+        Results are cached per file path, modification time and size. A cached message
+        is reused when it kept every segment type in wanted.
+        """
+        wanted_set = frozenset(wanted) if wanted is not None else None
+        stat = os.stat(file_path)
+        key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+        
+        cached = _PARSE_CACHE.get(key)
+        if cached is not None:
+            cached_wanted, cached_message = cached
+            if cached_wanted is None or (wanted_set is not None and wanted_set <= cached_wanted):
+                _PARSE_CACHE.move_to_end(key)
+                return cached_message
+        
+        message = HL7Parser._parse_file(file_path, wanted_set)
+        _PARSE_CACHE[key] = (wanted_set, message)
+        _PARSE_CACHE.move_to_end(key)
+        if len(_PARSE_CACHE) > _PARSE_CACHE_MAXSIZE:
+            _PARSE_CACHE.popitem(last=False)
+        return message
+    
+    @staticmethod
+    async def parse_many_async(file_paths: Iterable[str],
+                               wanted: Optional[Iterable[str]] = None) -> List[HL7Message]:
+        """
+        Parse many HL7 files concurrently, returning messages in the order of file_paths.
+        
+        Each file is read and parsed on the event loop's default thread pool, so blocking
+        reads of one file overlap with parsing of the others.
+        """
+        loop = asyncio.get_running_loop()
+        wanted_set = frozenset(wanted) if wanted is not None else None
+        return list(await asyncio.gather(*(
+            loop.run_in_executor(None, HL7Parser.parse_from_file, file_path, wanted_set)
+            for file_path in file_paths
+        )))
+    
+    @staticmethod
+    def parse_oru_obx(message_text: str) -> List[OBXRow]:
+        """
+        Extract OBX observation rows from an ORU message without building HL7 objects.
+        
+        Each OBX line is split once and read by fixed position
+        (OBX|set_id|value_type|identifier^name^coding|sub_id|value|units|ref_range|flags).
+        """
+        rows: List[OBXRow] = []
+        for line in _SEGMENT_TERMINATOR.split(message_text):
+            line = _strip_line(line)
+            if not line.startswith('OBX|'):
+                continue
+            fields = line.split('|')
+            fields.extend([''] * (9 - len(fields)))
+            identifier, _, rest = fields[3].partition('^')
+            rows.append(OBXRow(
+                set_id=int(fields[1]) if fields[1].isdigit() else 0,
+                identifier=identifier,
+                name=rest.partition('^')[0],
+                value=fields[5],
+                units=fields[6],
+                flags=fields[8],
+            ))
+        return rows
+    
+    @staticmethod
+    def clear_cache() -> None:
+        """Drop all cached messages parsed by parse_from_file."""
+        _PARSE_CACHE.clear()
+    
+    @staticmethod
+    def parse_from_bytes(data: Union[bytes, bytearray, memoryview, mmap.mmap],
+                         wanted: Optional[Iterable[str]] = None) -> HL7Message:
+        """
+        Parse an HL7 message from raw bytes, a memoryview or a memory map.
+        
+        Segment lines are sliced from the buffer one at a time and decoded individually,
+        so the whole message is never copied into a single str; the returned message's
+        `message_text` is None.
+        """
+        wanted_set = frozenset(wanted) if wanted is not None else None
+        return HL7Message(lines=HL7Parser._iter_lines(data, wanted_set), wanted=wanted_set)
+    
+    @staticmethod
+    def _parse_file(file_path: str, wanted: Optional[FrozenSet[str]]) -> HL7Message:
+        """Parse an HL7 file through a memory map without consulting the cache."""
+        with open(file_path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return HL7Message()
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return HL7Parser.parse_from_bytes(mapped, wanted)
+    
+    @staticmethod
+    def _iter_lines(data: Union[bytes, bytearray, memoryview, mmap.mmap],
+                    wanted: Optional[FrozenSet[str]] = None) -> Iterator[str]:
+        """
+        Yield decoded segment lines from an HL7 byte buffer.
+        
+        Segments are located and filtered as bytes (HL7 separators are ASCII) by scanning
+        for the next CR or LF, so each copy out of the buffer is one wanted segment line,
+        whether the file uses CR, LF or CRLF terminators.
+        """
+        for match in _segment_line_pattern(wanted).finditer(data):
+            yield match.group().decode('utf-8', 'replace')
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
     def format_date(date_string: str, input_format: str = "YYYYMMDD") -> Optional[str]:
         """Format HL7 date string to ISO format."""
         if not date_string:
             return None
         
+        date_format = _DATE_FORMATS.get(input_format)
+        if date_format is None:
+            return date_string
+        width, output_template = date_format
+        if len(date_string) != width or not date_string.isdigit():
+            return date_string
+        
+        # Fixed-width HL7 dates are reformatted by slicing; building a datetime from the
+        # integer parts still rejects impossible dates without strptime's format parsing
+        parts = [date_string[start:end] for start, end in _DATE_PART_SLICES if end <= width]
         try:
-            if input_format == "YYYYMMDD" and len(date_string) == 8:
-                dt = datetime.strptime(date_string, "%Y%m%d")
-                return dt.strftime("%Y-%m-%d")
-            elif input_format == "YYYYMMDDHHMM" and len(date_string) == 12:
-                dt = datetime.strptime(date_string, "%Y%m%d%H%M")
-                return dt.strftime("%Y-%m-%d %H:%M")
-            else:
-                return date_string
+            # Formats without a time part validate as midnight
+            datetime(int(parts[0]), int(parts[1]), int(parts[2]),
+                     int(parts[3]) if len(parts) > 3 else 0,
+                     int(parts[4]) if len(parts) > 4 else 0)
         except ValueError:
             return date_string
+        return output_template.format(*parts)
+    
+    @staticmethod
+    def format_dates(date_strings: Iterable[str], input_format: str = "YYYYMMDD") -> List[Optional[str]]:
+        """Format a column of HL7 date strings to ISO format in one pass."""
+        format_date = HL7Parser.format_date
+        return [format_date(date_string, input_format) for date_string in date_strings]
     
     @staticmethod
-    def validate_message(message: HL7Message) -> List[str]:
+    def validate_message(message: HL7Message) -> List[HL7ValidationError]:
         """Validate HL7 message structure and return list of errors."""
-        errors: List[str] = []
+        errors: List[HL7ValidationError] = []
         
         # Check for required MSH segment
         if not message.get_segment('MSH'):
-            errors.append("Missing required MSH segment")
+            errors.append(HL7ValidationError.MISSING_MSH)
         
         # Check for required PID segment for ADT messages
         msh = message.get_segment('MSH')
         if msh:
-            message_type = msh.get_field(9)
-            if message_type and 'ADT' in message_type.value:
+            if len(msh.fields) > 8 and 'ADT' in msh.fields[8]:
                 if not message.get_segment('PID'):
-                    errors.append("Missing required PID segment for ADT message")
+                    errors.append(HL7ValidationError.MISSING_PID)
         
         return errors 
\ No newline at end of file
@@ -6,44 +6,271 @@ HL7 and XML formats based on JSON mapping configurations. Designed to demonstrat
 AI-accelerated development of healthcare interface transformations.
 """
 
+import functools
+import itertools
 import json
 import os
+import re
 import glob
-from typing import Dict, Optional, Any, cast, List
-from xml.etree.ElementTree import Element, SubElement, tostring, fromstring
-from xml.dom import minidom
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, FrozenSet, Optional, Any, cast, List, Tuple
+from lxml.etree import Element, ElementTree, SubElement, fromstring, _Element  # type: ignore[import-untyped]
 from datetime import datetime
 import sys
 
 from hl7_parser import HL7Parser, HL7Message
 
 
+# Transformation direction codes, resolved once from the config's input/output formats
+DIRECTION_UNSUPPORTED = -1
+DIRECTION_HL7_TO_XML = 0
+DIRECTION_XML_TO_HL7 = 1
+
+# Below this many files, process start-up costs more than parallel parsing saves
+PARALLEL_MIN_FILES = 4
+
+
 class TransformationError(Exception):
     """Custom exception for transformation errors."""
     pass
 
 
+SectionHandler = Callable[[_Element, HL7Message, str, Dict[str, Any]], None]
+
+# (input_file, output_file, direction, control_id) for one process_directory file
+TransformTask = Tuple[str, str, int, Optional[int]]
+
+# Node of the fixed-schema XML template: (xml_tag, field_config, children). Leaves carry the
+# field config of the value they emit; groups carry None and always emit their element.
+TemplateNode = Tuple[str, Optional[Dict[str, Any]], List['TemplateNode']]
+
+# Sections whose output shape depends only on the mapping config, not on segment repeats
+FIXED_SCHEMA_SECTIONS = ("message_header", "patient", "visit", "custom_segments")
+
+# Characters lxml refuses in XML text and attribute values
+_INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+_XML_TEXT_ESCAPES = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;', '\r': '&#13;'})
+_XML_ATTRIBUTE_ESCAPES = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;',
+                                        '\n': '&#10;', '\t': '&#9;', '\r': '&#13;'})
+
+
+def extract_fields(segment_fields: List[str], section_fields: List[Tuple[str, int, int]]) -> List[Tuple[str, str]]:
+    """
+    Extract the non-empty (xml_tag, value) pairs of one segment for pre-parsed field sources.
+    
+    Each field is split into components at most once, however many sources read from it.
+    """
+    field_count = len(segment_fields)
+    split_fields: Dict[int, List[str]] = {}
+    extracted: List[Tuple[str, str]] = []
+    for xml_tag, field_index, component_index in section_fields:
+        if field_index > field_count or field_index <= 0:
+            continue
+        field_value = segment_fields[field_index - 1]
+        if component_index > 1 and field_value:
+            components = split_fields.get(field_index)
+            if components is None:
+                components = split_fields[field_index] = field_value.split('^')
+            field_value = components[component_index - 1] if component_index <= len(components) else ""
+        if field_value:
+            extracted.append((xml_tag, field_value))
+    return extracted
+
+
+def _valid_template_tags(nodes: List[TemplateNode]) -> bool:
+    """Check that lxml accepts every tag name in a template; the tree path raises on the first bad one."""
+    for xml_tag, _, children in nodes:
+        try:
+            Element(xml_tag)
+        except ValueError:
+            return False
+        if not _valid_template_tags(children):
+            return False
+    return True
+
+
+def _escape_xml(value: str, escapes: Dict[int, str]) -> str:
+    """Escape a value for the template writer exactly as lxml's serializer would."""
+    if _INVALID_XML_CHARS.search(value):
+        raise ValueError("All strings must be XML compatible: Unicode or ASCII, no NULL bytes or control characters")
+    return value.translate(escapes)
+
+
+@functools.lru_cache(maxsize=8)
+def _cached_load(config_path: str, mtime_ns: int, size: int) -> Dict[str, Any]:
+    """
+    Read a mapping config once per (path, modification time, size).
+    
+    Transformers built from the same unchanged file, e.g. by every process pool worker
+    or repeated CLI runs in one process, share the parsed dict. It must not be mutated.
+    """
+    with open(config_path, 'r', encoding='utf-8') as file:
+        config: Dict[str, Any] = json.load(file)
+    return config
+
+
 class BidirectionalTransformer:
     """Main transformer class for converting between HL7 and XML formats."""
     
-    def __init__(self, mapping_config_path: str):
+    def __init__(self, mapping_config_path: str, verbose: bool = True):
         """
         Initialize transformer with mapping configuration.
         
         Args:
             mapping_config_path: Path to JSON mapping configuration file
+            verbose: Report per-file progress and validation warnings; errors are always reported
         """
+        self.mapping_config_path = mapping_config_path
+        self.verbose = verbose
+        self._log: List[str] = []
         self.mapping_config = self._load_mapping_config(mapping_config_path)
         self.mappings = self.mapping_config.get('mappings', {})
         self.input_format = self.mapping_config.get('input_format', 'hl7')
         self.output_format = self.mapping_config.get('output_format', 'xml')
+        self._direction = {
+            ('hl7', 'xml'): DIRECTION_HL7_TO_XML,
+            ('xml', 'hl7'): DIRECTION_XML_TO_HL7,
+        }.get((self.input_format.lower(), self.output_format.lower()), DIRECTION_UNSUPPORTED)
+        self._wanted_segments = self._collect_referenced_segments(self.mappings)
+        self._section_fields: Dict[str, List[Tuple[str, int, int]]] = {}
+        self._observation_filters: Dict[str, FrozenSet[str]] = {}
+        self._dispatch = self._compile_dispatch()
+        self._xml_template = self._compile_xml_template()
+        self._control_ids = itertools.count(1)
+        # (output_base_dir, {'hl7': [...], 'xml': [...]}) written by the last process_directory run
+        self._last_written: Optional[Tuple[str, Dict[str, List[str]]]] = None
+        self._start_run()
+    
+    def _start_run(self, run_time: Optional[datetime] = None) -> None:
+        """Stamp the current run; every message in the run shares these timestamps."""
+        if run_time is None:
+            run_time = datetime.now()
+        self._run_time = run_time
+        self._run_timestamp = run_time.isoformat()
+        self._run_hl7_timestamp = run_time.strftime("%Y%m%d%H%M")
+    
+    def _log_message(self, message: str, always: bool = False) -> None:
+        """Queue a progress line for the next _flush_log; non-error lines need verbose."""
+        if always or self.verbose:
+            self._log.append(message)
+    
+    def _flush_log(self) -> None:
+        """Write all queued progress lines to stdout in one call."""
+        if self._log:
+            sys.stdout.write('\n'.join(self._log) + '\n')
+            self._log.clear()
+    
+    def _compile_dispatch(self) -> List[Tuple[SectionHandler, str, Dict[str, Any]]]:
+        """Resolve the handler for each mapping section once, in mapping order."""
+        handlers: Dict[str, SectionHandler] = {
+            "message_header": self._process_message_header,
+            "patient": self._process_patient,
+            "visit": self._process_visit,
+            "custom_segments": self._process_custom_segments,
+        }
+        
+        dispatch: List[Tuple[SectionHandler, str, Dict[str, Any]]] = []
+        for section_name, section_config in self.mappings.items():
+            handler = handlers.get(section_name)
+            if handler is None:
+                if section_config.get('source') == 'OBX':
+                    handler = self._process_obx_section
+                    observation_ids = section_config.get('filter', {}).get('observation_id', [])
+                    self._observation_filters[section_name] = frozenset(observation_ids)
+                elif section_name in ("allergies", "diagnoses"):
+                    handler = self._process_array_section
+                else:
+                    continue
+                self._section_fields[section_name] = self._compile_segment_fields(section_name, section_config)
+            dispatch.append((handler, section_name, section_config))
+        return dispatch
+    
+    def _compile_xml_template(self) -> Optional[List[TemplateNode]]:
+        """
+        Compile fixed-schema mapping sections into an XML template.
+        
+        Returns None when the config has array or OBX sections, whose element count
+        depends on the message, or a field name lxml rejects as a tag; those configs
+        always go through the Element tree, which reports invalid tags per file.
+        """
+        template: List[TemplateNode] = []
+        for _, section_name, section_config in self._dispatch:
+            if section_name not in FIXED_SCHEMA_SECTIONS:
+                return None
+            
+            if section_name == "message_header":
+                template.append(("MessageHeader", None, [
+                    (self._camel_case(field_name), field_config, [])
+                    for field_name, field_config in section_config.items()
+                ]))
+            elif section_name == "custom_segments":
+                template.append(("CustomSegments", None, [
+                    (self._camel_case(segment_name), None, [
+                        (self._camel_case(field_name), field_config, [])
+                        for field_name, field_config in segment_config.items()
+                    ])
+                    for segment_name, segment_config in section_config.items()
+                ]))
+            else:
+                # Patient and visit: simple fields plus nested objects (address, location, ...)
+                children: List[TemplateNode] = []
+                for field_name, field_config in section_config.items():
+                    if 'source' in field_config:
+                        children.append((self._camel_case(field_name), field_config, []))
+                    else:
+                        children.append((self._camel_case(field_name), None, [
+                            (self._camel_case(nested_field), nested_config, [])
+                            for nested_field, nested_config in field_config.items()
+                            if 'source' in nested_config
+                        ]))
+                template.append((self._camel_case(section_name), None, children))
+        return template if _valid_template_tags(template) else None
+    
+    def _compile_segment_fields(self, section_name: str, config: Dict[str, Any]) -> List[Tuple[str, int, int]]:
+        """
+        Pre-parse the field sources of a repeating-segment section.
+        
+        Returns (xml_tag, field_index, component_index) for each field whose source is
+        'SEGMENT.FIELD[.COMPONENT]', so segments are read without re-splitting references.
+        """
+        compiled: List[Tuple[str, int, int]] = []
+        for field_name, field_config in config.get('fields', {}).items():
+            field_config = cast(Dict[str, Any], field_config)
+            if 'source' not in field_config:
+                continue
+            field_reference = cast(str, field_config['source'])
+            field_parts = field_reference.split('.')
+            if len(field_parts) < 2:
+                continue
+            try:
+                field_index = int(field_parts[1])
+                component_index = int(field_parts[2]) if len(field_parts) > 2 else 1
+            except ValueError:
+                raise TransformationError(f"Invalid field source '{field_reference}' in section '{section_name}'")
+            compiled.append((self._camel_case(field_name), field_index, component_index))
+        return compiled
+    
+    def _collect_referenced_segments(self, config: Dict[str, Any]) -> FrozenSet[str]:
+        """Collect the HL7 segment types referenced by 'source' entries in the mapping config."""
+        # PID is always kept because validate_message checks for it on ADT messages
+        segment_types = {'PID'}
+        pending: List[Dict[str, Any]] = [config]
+        while pending:
+            node = pending.pop()
+            source = node.get('source')
+            if isinstance(source, str):
+                segment_types.add(source.split('.', 1)[0])
+            pending.extend(value for value in node.values() if isinstance(value, dict))
+        return frozenset(segment_types)
     
     def _load_mapping_config(self, config_path: str) -> Dict[str, Any]:
-        """Load and validate mapping configuration from JSON file."""
+        """Load and validate mapping configuration from JSON file, cached per modification time and size."""
         try:
-            with open(config_path, 'r', encoding='utf-8') as file:
-                config: Dict[str, Any] = json.load(file)
-            return config
+            config_path = os.path.abspath(config_path)
+            # Size is part of the key, as in the HL7 parse cache, so a rewrite within the
+            # filesystem's timestamp granularity is still picked up
+            stat = os.stat(config_path)
+            return _cached_load(config_path, stat.st_mtime_ns, stat.st_size)
         except FileNotFoundError:
             raise TransformationError(f"Mapping configuration file not found: {config_path}")
         except json.JSONDecodeError as e:
@@ -60,136 +287,202 @@ class BidirectionalTransformer:
         Returns:
             List of processed file paths
         """
+        self._start_run()
+        
         # Ensure output directories exist
         hl7_output_dir = os.path.join(output_base_dir, 'hl7_output')
         xml_output_dir = os.path.join(output_base_dir, 'xml_output')
         os.makedirs(hl7_output_dir, exist_ok=True)
         os.makedirs(xml_output_dir, exist_ok=True)
         
-        processed_files: List[str] = []
+        # Collect (input_file, output_file, direction, control_id) tasks for this transformer's
+        # direction; control IDs are assigned here so parallel workers never reuse one
+        tasks: List[TransformTask] = []
         
         # Process HL7 files (input_base_dir/hl7/*.hl7 -> output_base_dir/xml_output/*.xml)
         hl7_input_dir = os.path.join(input_base_dir, 'hl7')
-        if os.path.exists(hl7_input_dir):
-            hl7_pattern = os.path.join(hl7_input_dir, '*.hl7')
-            hl7_files = glob.glob(hl7_pattern)
-            
-            for input_file in hl7_files:
-                try:
-                    base_name = os.path.splitext(os.path.basename(input_file))[0]
-                    output_file = os.path.join(xml_output_dir, f"{base_name}.xml")
-                    
-                    if self.input_format.lower() == 'hl7' and self.output_format.lower() == 'xml':
-                        self._transform_hl7_to_xml(input_file, output_file)
-                        processed_files.append(output_file)
-                    
-                except Exception as e:
-                    print(f"Error processing {input_file}: {e}")
-                    continue
+        if os.path.exists(hl7_input_dir) and self._direction == DIRECTION_HL7_TO_XML:
+            for input_file, base_name in self._list_input_files(hl7_input_dir, '.hl7'):
+                output_file = os.path.join(xml_output_dir, f"{base_name}.xml")
+                tasks.append((input_file, output_file, DIRECTION_HL7_TO_XML, None))
         
         # Process XML files (input_base_dir/xml/*.xml -> output_base_dir/hl7_output/*.hl7)
         xml_input_dir = os.path.join(input_base_dir, 'xml')
-        if os.path.exists(xml_input_dir):
-            xml_pattern = os.path.join(xml_input_dir, '*.xml')
-            xml_files = glob.glob(xml_pattern)
-            
-            for input_file in xml_files:
-                try:
-                    base_name = os.path.splitext(os.path.basename(input_file))[0]
-                    output_file = os.path.join(hl7_output_dir, f"{base_name}.hl7")
-                    
-                    if self.input_format.lower() == 'xml' and self.output_format.lower() == 'hl7':
-                        self._transform_xml_to_hl7(input_file, output_file)
-                        processed_files.append(output_file)
-                    
-                except Exception as e:
-                    print(f"Error processing {input_file}: {e}")
-                    continue
-        
-        return processed_files
+        if os.path.exists(xml_input_dir) and self._direction == DIRECTION_XML_TO_HL7:
+            for input_file, base_name in self._list_input_files(xml_input_dir, '.xml'):
+                output_file = os.path.join(hl7_output_dir, f"{base_name}.hl7")
+                tasks.append((input_file, output_file, DIRECTION_XML_TO_HL7, next(self._control_ids)))
+        
+        results: List[Optional[str]]
+        if len(tasks) < PARALLEL_MIN_FILES:
+            results = [self._transform_task(task) for task in tasks]
+        else:
+            # Files are independent and CPU-bound, so spread them across processes; each
+            # worker loads the mapping config once in its initializer and shares this run's timestamp
+            results = []
+            with ProcessPoolExecutor(initializer=_init_worker,
+                                     initargs=(self.mapping_config_path, self._run_time, self.verbose)) as executor:
+                for written_file, log_lines in executor.map(_run_worker_task, tasks, chunksize=4):
+                    results.append(written_file)
+                    self._log.extend(log_lines)
+        
+        # Progress and error lines for the whole run go out in a single write
+        self._flush_log()
+        
+        written = [output_file for output_file in results if output_file]
+        self._last_written = (output_base_dir, {
+            'hl7': [f for f in written if f.startswith(hl7_output_dir)],
+            'xml': [f for f in written if f.startswith(xml_output_dir)],
+        })
+        return written
+    
+    def _list_input_files(self, input_dir: str, suffix: str) -> List[Tuple[str, str]]:
+        """List (path, base_name) for non-hidden files in input_dir ending with suffix."""
+        # scandir's DirEntry caches file type, so this needs no per-file stat or glob matching
+        with os.scandir(input_dir) as entries:
+            return [
+                (entry.path, entry.name.rpartition('.')[0])
+                for entry in entries
+                if entry.name.endswith(suffix) and not entry.name.startswith('.') and entry.is_file()
+            ]
+    
+    def _transform_task(self, task: TransformTask) -> Optional[str]:
+        """Transform one process_directory task; returns the output path or None on failure."""
+        input_file, output_file, direction, control_id = task
+        try:
+            if direction == DIRECTION_HL7_TO_XML:
+                self._transform_hl7_to_xml(input_file, output_file)
+            else:
+                self._transform_xml_to_hl7(input_file, output_file, control_id)
+            return output_file
+        except Exception as e:
+            self._log_message(f"Error processing {input_file}: {e}", always=True)
+            return None
     
     def transform_file(self, input_file_path: str, output_file_path: str) -> None:
         """
         Transform single file from input format to output format.
         
+        Uses the mapping config loaded at construction; the config file is never re-read.
+        Each call is its own run, so its output is stamped with the current time.
+        
         Args:
             input_file_path: Path to input file
             output_file_path: Path to output file
         """
+        self._start_run()
         try:
-            if self.input_format.lower() == 'hl7' and self.output_format.lower() == 'xml':
+            if self._direction == DIRECTION_HL7_TO_XML:
                 self._transform_hl7_to_xml(input_file_path, output_file_path)
-            elif self.input_format.lower() == 'xml' and self.output_format.lower() == 'hl7':
+            elif self._direction == DIRECTION_XML_TO_HL7:
                 self._transform_xml_to_hl7(input_file_path, output_file_path)
             else:
                 raise TransformationError(f"Unsupported transformation: {self.input_format} to {self.output_format}")
                 
-            print(f"✓ Transformed: {os.path.basename(input_file_path)} → {os.path.basename(output_file_path)}")
+            self._log_message(f"✓ Transformed: {os.path.basename(input_file_path)} → {os.path.basename(output_file_path)}")
             
         except Exception as e:
             raise TransformationError(f"Failed to transform {input_file_path}: {e}")
+        finally:
+            self._flush_log()
     
     def _transform_hl7_to_xml(self, input_file_path: str, output_file_path: str) -> None:
         """Transform HL7 file to XML."""
-        # Parse HL7 message
-        hl7_message = HL7Parser.parse_from_file(input_file_path)
+        # Parse HL7 message, skipping segments the mapping config never reads
+        hl7_message = HL7Parser.parse_from_file(input_file_path, wanted=self._wanted_segments)
         
         # Validate message
         errors = HL7Parser.validate_message(hl7_message)
         if errors:
-            print(f"⚠️  Validation warnings: {', '.join(errors)}")
+            self._log_message(f"⚠️  Validation warnings: {', '.join(map(str, errors))}")
+        
+        if self._xml_template is not None:
+            # Fixed-schema configs fill the precompiled template; no Element tree is built
+            with open(output_file_path, 'wb') as file:
+                file.write(self._render_xml_template(hl7_message))
+            return
         
         # Transform to XML
         xml_element = self._hl7_to_xml_element(hl7_message)
-        xml_string = self._format_xml(xml_element)
         
-        # Write to output file
-        with open(output_file_path, 'w', encoding='utf-8') as file:
-            file.write(xml_string)
+        # Serialize straight to the output file; no intermediate XML string is built
+        ElementTree(xml_element).write(output_file_path, encoding='utf-8', xml_declaration=True, pretty_print=True)
     
-    def _transform_xml_to_hl7(self, input_file_path: str, output_file_path: str) -> None:
+    def _transform_xml_to_hl7(self, input_file_path: str, output_file_path: str,
+                              control_id: Optional[int] = None) -> None:
         """Transform XML file to HL7."""
-        # Parse XML
-        with open(input_file_path, 'r', encoding='utf-8') as file:
+        # Parse XML (as bytes, so lxml honours the document's own encoding declaration)
+        with open(input_file_path, 'rb') as file:
             xml_content = file.read()
         
         xml_element = fromstring(xml_content)
         
         # Transform to HL7
-        hl7_content = self._xml_to_hl7_string(xml_element)
+        hl7_content = self._xml_to_hl7_string(xml_element, control_id)
+        
+        # Write pre-encoded bytes, bypassing the text-mode encoder layer
+        with open(output_file_path, 'wb') as file:
+            file.write(hl7_content.encode('utf-8'))
+    
+    def _render_xml_template(self, hl7_message: HL7Message) -> bytes:
+        """Render the fixed-schema template to UTF-8 XML identical to the file ElementTree.write produces."""
+        assert self._xml_template is not None
+        root_attributes = (
+            f'version="1.0" timestamp="{_escape_xml(self._run_timestamp, _XML_ATTRIBUTE_ESCAPES)}" '
+            f'transformation_config="{_escape_xml(self.mapping_config.get("config_name", "default"), _XML_ATTRIBUTE_ESCAPES)}"'
+        )
+        lines: List[str] = ["<?xml version='1.0' encoding='UTF-8'?>"]
+        if self._xml_template:
+            lines.append(f"<HealthcareMessage {root_attributes}>")
+            for node in self._xml_template:
+                self._render_template_node(lines, hl7_message, node, 1)
+            lines.append("</HealthcareMessage>")
+        else:
+            lines.append(f"<HealthcareMessage {root_attributes}/>")
+        lines.append("")
+        return "\n".join(lines).encode('utf-8')
+    
+    def _render_template_node(self, lines: List[str], hl7_message: HL7Message,
+                              node: TemplateNode, depth: int) -> None:
+        """Append the lines for one template node, mirroring the Element-based section handlers."""
+        xml_tag, field_config, children = node
+        indent = "  " * depth
         
-        # Write to output file
-        with open(output_file_path, 'w', encoding='utf-8') as file:
-            file.write(hl7_content)
+        if field_config is not None:
+            value = self._extract_field_value(hl7_message, field_config)
+            if value or field_config.get('required', False):
+                lines.append(f"{indent}<{xml_tag}>{_escape_xml(value or '', _XML_TEXT_ESCAPES)}</{xml_tag}>")
+            return
+        
+        start = len(lines)
+        lines.append(f"{indent}<{xml_tag}>")
+        for child in children:
+            self._render_template_node(lines, hl7_message, child, depth + 1)
+        if len(lines) == start + 1:
+            lines[start] = f"{indent}<{xml_tag}/>"
+        else:
+            lines.append(f"{indent}</{xml_tag}>")
     
-    def _hl7_to_xml_element(self, hl7_message: HL7Message) -> Element:
+    def transform(self, hl7_message: HL7Message) -> _Element:
+        """Transform a parsed HL7 message into its XML element tree without writing a file."""
+        self._start_run()
+        return self._hl7_to_xml_element(hl7_message)
+    
+    def _hl7_to_xml_element(self, hl7_message: HL7Message) -> _Element:
         """Convert HL7 message to XML Element."""
         # Create root XML element
         root = Element("HealthcareMessage")
         root.set("version", "1.0")
-        root.set("timestamp", datetime.now().isoformat())
+        root.set("timestamp", self._run_timestamp)
         root.set("transformation_config", self.mapping_config.get('config_name', 'default'))
         
-        # Process each section in the mapping
-        for section_name, section_config in self.mappings.items():
-            if section_name == "message_header":
-                self._process_message_header(root, hl7_message, section_config)
-            elif section_name == "patient":
-                self._process_patient(root, hl7_message, section_config)
-            elif section_name == "visit":
-                self._process_visit(root, hl7_message, section_config)
-            elif section_name == "custom_segments":
-                self._process_custom_segments(root, hl7_message, section_config)
-            elif section_config.get('source') == 'OBX':
-                self._process_obx_section(root, hl7_message, section_name, section_config)
-            elif section_name == "allergies":
-                self._process_array_section(root, hl7_message, section_name, section_config)
-            elif section_name == "diagnoses":
-                self._process_array_section(root, hl7_message, section_name, section_config)
+        # Process each section through its precompiled handler
+        for handler, section_name, section_config in self._dispatch:
+            handler(root, hl7_message, section_name, section_config)
         
         return root
     
-    def _xml_to_hl7_string(self, xml_element: Element) -> str:
+    def _xml_to_hl7_string(self, xml_element: _Element, control_id: Optional[int] = None) -> str:
         """Convert XML Element to HL7 string."""
         # This is a simplified reverse transformation
         # In a real system, this would be much more complex
@@ -198,8 +491,8 @@ class BidirectionalTransformer:
         
         # Generate MSH segment
         msh_line = "MSH|^~\\&|DEMO|SYSTEM|TARGET|SYSTEM|" + \
-                  datetime.now().strftime("%Y%m%d%H%M") + "||ADT^A01^ADT_A01|" + \
-                  str(hash(xml_element.get('timestamp', '')) % 10000) + "|P|2.5"
+                  self._run_hl7_timestamp + "||ADT^A01^ADT_A01|" + \
+                  str(control_id if control_id is not None else next(self._control_ids)) + "|P|2.5"
         lines.append(msh_line)
         
         # Extract patient info
@@ -225,21 +518,21 @@ class BidirectionalTransformer:
         
         return "\n".join(lines)
     
-    def _process_custom_segments(self, parent: Element, hl7_message: HL7Message, config: Dict[str, Any]) -> None:
+    def _process_custom_segments(self, parent: _Element, hl7_message: HL7Message, section_name: str, config: Dict[str, Any]) -> None:
         """Process custom Z-segments (Meditech-style segments)."""
         custom_elem = SubElement(parent, "CustomSegments")
         
-        for section_name, section_config in config.items():
-            section_elem = SubElement(custom_elem, self._camel_case(section_name))
+        for segment_name, segment_config in config.items():
+            section_elem = SubElement(custom_elem, self._camel_case(segment_name))
             
-            for field_name, field_config in section_config.items():
+            for field_name, field_config in segment_config.items():
                 field_config = cast(Dict[str, Any], field_config)
                 value = self._extract_field_value(hl7_message, field_config)
                 if value or field_config.get('required', False):
                     field_elem = SubElement(section_elem, self._camel_case(field_name))
                     field_elem.text = value or ""
     
-    def _process_message_header(self, parent: Element, hl7_message: HL7Message, config: Dict[str, Any]) -> None:
+    def _process_message_header(self, parent: _Element, hl7_message: HL7Message, section_name: str, config: Dict[str, Any]) -> None:
         """Process message header section."""
         header_elem = SubElement(parent, "MessageHeader")
         
@@ -250,7 +543,7 @@ class BidirectionalTransformer:
                 field_elem = SubElement(header_elem, self._camel_case(field_name))
                 field_elem.text = value or ""
     
-    def _process_patient(self, parent: Element, hl7_message: HL7Message, config: Dict[str, Any]) -> None:
+    def _process_patient(self, parent: _Element, hl7_message: HL7Message, section_name: str, config: Dict[str, Any]) -> None:
         """Process patient information section."""
         patient_elem = SubElement(parent, "Patient")
         
@@ -273,7 +566,7 @@ class BidirectionalTransformer:
                             nested_field_elem = SubElement(nested_elem, self._camel_case(nested_field))
                             nested_field_elem.text = value or ""
     
-    def _process_visit(self, parent: Element, hl7_message: HL7Message, config: Dict[str, Any]) -> None:
+    def _process_visit(self, parent: _Element, hl7_message: HL7Message, section_name: str, config: Dict[str, Any]) -> None:
         """Process visit information section."""
         visit_elem = SubElement(parent, "Visit")
         
@@ -296,7 +589,7 @@ class BidirectionalTransformer:
                             nested_field_elem = SubElement(nested_elem, self._camel_case(nested_field))
                             nested_field_elem.text = value or ""
     
-    def _process_array_section(self, parent: Element, hl7_message: HL7Message, section_name: str, config: Dict[str, Any]) -> None:
+    def _process_array_section(self, parent: _Element, hl7_message: HL7Message, section_name: str, config: Dict[str, Any]) -> None:
         """Process array sections like allergies and diagnoses."""
         section_elem = SubElement(parent, self._camel_case(section_name))
         
@@ -305,70 +598,36 @@ class BidirectionalTransformer:
             return
         
         segments = hl7_message.get_segments(segment_type)
+        section_fields = self._section_fields[section_name]
         
         for segment in segments:
             item_elem = SubElement(section_elem, self._camel_case(section_name[:-1]))  # Remove 's' for singular
-            
-            fields_config = config.get('fields', {})
-            for field_name, field_config in fields_config.items():
-                field_config = cast(Dict[str, Any], field_config)
-                if 'source' in field_config:
-                    # Extract value from current segment
-                    field_reference = cast(str, field_config['source'])
-                    # Replace segment type with current segment data
-                    segment_fields = segment.fields
-                    field_parts = field_reference.split('.')
-                    
-                    if len(field_parts) >= 2:
-                        field_index = int(field_parts[1])
-                        component_index = int(field_parts[2]) if len(field_parts) > 2 else 1
-                        
-                        if field_index <= len(segment_fields):
-                            field_value = segment_fields[field_index - 1] if field_index > 0 else ""
-                            if component_index > 1 and field_value:
-                                components = field_value.split('^')
-                                field_value = components[component_index - 1] if component_index <= len(components) else ""
-                            
-                            if field_value:
-                                field_elem = SubElement(item_elem, self._camel_case(field_name))
-                                field_elem.text = field_value
-    
-    def _process_obx_section(self, parent: Element, hl7_message: HL7Message, section_name: str, config: Dict[str, Any]) -> None:
+            self._add_segment_fields(item_elem, segment.fields, section_fields)
+    
+    def _process_obx_section(self, parent: _Element, hl7_message: HL7Message, section_name: str, config: Dict[str, Any]) -> None:
         """Process OBX segments with filtering based on observation IDs."""
         section_elem = SubElement(parent, self._camel_case(section_name))
         
         obx_segments = hl7_message.get_segments('OBX')
-        filter_config = config.get('filter', {})
-        observation_ids = filter_config.get('observation_id', [])
+        observation_ids = self._observation_filters[section_name]
+        section_fields = self._section_fields[section_name]
         
         for segment in obx_segments:
             # Check if this OBX segment matches our filter
-            if len(segment.fields) > 3:
-                observation_id = segment.fields[3].split('^')[0] if segment.fields[3] else ""
+            segment_fields = segment.fields
+            if len(segment_fields) > 3:
+                # Only the identifier component is needed; partition stops at the first '^'
+                observation_id = segment_fields[3].partition('^')[0]
                 
                 if not observation_ids or observation_id in observation_ids:
                     item_elem = SubElement(section_elem, self._camel_case(section_name[:-1]) if section_name.endswith('s') else self._camel_case(section_name))
-                    
-                    fields_config = config.get('fields', {})
-                    for field_name, field_config in fields_config.items():
-                        field_config = cast(Dict[str, Any], field_config)
-                        if 'source' in field_config:
-                            field_reference = cast(str, field_config['source'])
-                            field_parts = field_reference.split('.')
-                            
-                            if len(field_parts) >= 2:
-                                field_index = int(field_parts[1])
-                                component_index = int(field_parts[2]) if len(field_parts) > 2 else 1
-                                
-                                if field_index <= len(segment.fields):
-                                    field_value = segment.fields[field_index - 1] if field_index > 0 else ""
-                                    if component_index > 1 and field_value:
-                                        components = field_value.split('^')
-                                        field_value = components[component_index - 1] if component_index <= len(components) else ""
-                                    
-                                    if field_value:
-                                        field_elem = SubElement(item_elem, self._camel_case(field_name))
-                                        field_elem.text = field_value
+                    self._add_segment_fields(item_elem, segment_fields, section_fields)
+    
+    def _add_segment_fields(self, item_elem: _Element, segment_fields: List[str],
+                            section_fields: List[Tuple[str, int, int]]) -> None:
+        """Add one element per non-empty pre-parsed field source of a segment."""
+        for xml_tag, field_value in extract_fields(segment_fields, section_fields):
+            SubElement(item_elem, xml_tag).text = field_value
     
     def _extract_field_value(self, hl7_message: HL7Message, field_config: Dict[str, Any]) -> Optional[str]:
         """Extract field value from HL7 message based on field configuration."""
@@ -391,24 +650,29 @@ class BidirectionalTransformer:
         
         return value
     
-    def _camel_case(self, snake_str: str) -> str:
-        """Convert snake_case to CamelCase."""
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def _camel_case(snake_str: str) -> str:
+        """Convert snake_case to CamelCase (memoized; names come from the fixed mapping config)."""
         components = snake_str.split('_')
         return ''.join(word.capitalize() for word in components)
     
-    def _format_xml(self, xml_element: Element) -> str:
-        """Format XML with proper indentation."""
-        xml_string = tostring(xml_element, encoding='unicode')
-        dom = minidom.parseString(xml_string)
-        return dom.toprettyxml(indent="  ")
-    
     def get_transformation_summary(self, output_base_dir: str) -> Dict[str, Any]:
-        """Get summary of transformation results."""
-        hl7_output_dir = os.path.join(output_base_dir, 'hl7_output')
-        xml_output_dir = os.path.join(output_base_dir, 'xml_output')
+        """
+        Get summary of transformation results.
         
-        hl7_files = glob.glob(os.path.join(hl7_output_dir, '*')) if os.path.exists(hl7_output_dir) else []
-        xml_files = glob.glob(os.path.join(xml_output_dir, '*')) if os.path.exists(xml_output_dir) else []
+        After process_directory into output_base_dir, the files it wrote are summarized
+        directly; otherwise the output directories are scanned.
+        """
+        if self._last_written is not None and self._last_written[0] == output_base_dir:
+            hl7_files = self._last_written[1]['hl7']
+            xml_files = self._last_written[1]['xml']
+        else:
+            hl7_output_dir = os.path.join(output_base_dir, 'hl7_output')
+            xml_output_dir = os.path.join(output_base_dir, 'xml_output')
+            
+            hl7_files = glob.glob(os.path.join(hl7_output_dir, '*')) if os.path.exists(hl7_output_dir) else []
+            xml_files = glob.glob(os.path.join(xml_output_dir, '*')) if os.path.exists(xml_output_dir) else []
         
         summary = {
             'files_processed': len(hl7_files) + len(xml_files),
@@ -424,6 +688,31 @@ class BidirectionalTransformer:
         return summary
 
 
+# Transformer owned by a process_directory worker process, set by _init_worker
+_worker_transformer: Optional[BidirectionalTransformer] = None
+
+
+def _init_worker(config_path: str, run_time: datetime, verbose: bool) -> None:
+    """Process pool initializer: load the mapping config once per worker."""
+    global _worker_transformer
+    _worker_transformer = BidirectionalTransformer(config_path, verbose)
+    _worker_transformer._start_run(run_time)
+
+
+def _run_worker_task(task: TransformTask) -> Tuple[Optional[str], List[str]]:
+    """
+    Process pool entry point: transform one file with this worker's transformer.
+    
+    Returns the output path (None on failure) and the log lines queued for the file,
+    which the parent process writes out with the rest of the run.
+    """
+    assert _worker_transformer is not None, "worker not initialized"
+    output_file = _worker_transformer._transform_task(task)
+    log_lines = _worker_transformer._log[:]
+    _worker_transformer._log.clear()
+    return output_file, log_lines
+
+
 def main() -> None:
     """Main function to run the transformer."""
     # Set up paths
@@ -0,0 +1,11 @@
+"""
+Shared pytest configuration for the interface tests.
+
+Puts the src directory on the import path once, before any test module is collected.
+"""
+
+import os
+import sys
+
+# Add src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
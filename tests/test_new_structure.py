@@ -8,7 +8,7 @@ and that the enhanced config processes OBX segments properly.
 import os
 import sys
 import tempfile
-from xml.etree.ElementTree import fromstring
+from xml.etree.ElementTree import parse
 
 # Add src directory to path for imports
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
@@ -21,24 +21,18 @@ def test_basic_inbound_config():
     config_path = "config/inbound_config.json"
     hl7_file = "data/input/hl7/sample_meditech_adt.hl7"
     
-    # Create temporary output file
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.xml', delete=False) as temp_file:
-        output_path = temp_file.name
-    
-    try:
+    # Write output into a temporary directory that is removed along with its contents
+    with tempfile.TemporaryDirectory() as output_dir:
+        output_path = os.path.join(output_dir, "output.xml")
+        
         transformer = BidirectionalTransformer(config_path)
         transformer.transform_file(hl7_file, output_path)
         
         # Verify file was created
         assert os.path.exists(output_path), "Output file should exist"
         
-        # Parse and verify content
-        with open(output_path, 'r', encoding='utf-8') as f:
-            xml_content = f.read()
-        
-        # Remove XML declaration for parsing
-        xml_body = xml_content.split('?>')[1] if '?>' in xml_content else xml_content
-        root = fromstring(xml_body)
+        # Parse and verify content straight from the file; the parser handles the XML declaration
+        root = parse(output_path).getroot()
         
         # Should have basic sections
         assert root.find("MessageHeader") is not None, "Should have MessageHeader"
@@ -50,14 +44,11 @@ def test_basic_inbound_config():
         assert root.find("SogiInformation") is None, "Should NOT have SogiInformation with basic config"
         
         # Count lines - should be around 40 lines for basic output
-        line_count = len(xml_content.strip().split('\n'))
+        with open(output_path, 'r', encoding='utf-8') as f:
+            line_count = sum(1 for _ in f)
         assert 35 <= line_count <= 45, f"Basic config should produce ~40 lines, got {line_count}"
         
         print("✅ Basic inbound config test passed")
-        
-    finally:
-        if os.path.exists(output_path):
-            os.unlink(output_path)
 
 
 def test_enhanced_inbound_config():
@@ -65,24 +56,18 @@ def test_enhanced_inbound_config():
     config_path = "config/demo_configs/enhanced_inbound_config.json"
     hl7_file = "data/input/hl7/sample_meditech_adt.hl7"
     
-    # Create temporary output file
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.xml', delete=False) as temp_file:
-        output_path = temp_file.name
-    
-    try:
+    # Write output into a temporary directory that is removed along with its contents
+    with tempfile.TemporaryDirectory() as output_dir:
+        output_path = os.path.join(output_dir, "output.xml")
+        
         transformer = BidirectionalTransformer(config_path)
         transformer.transform_file(hl7_file, output_path)
         
         # Verify file was created
         assert os.path.exists(output_path), "Output file should exist"
         
-        # Parse and verify content
-        with open(output_path, 'r', encoding='utf-8') as f:
-            xml_content = f.read()
-        
-        # Remove XML declaration for parsing
-        xml_body = xml_content.split('?>')[1] if '?>' in xml_content else xml_content
-        root = fromstring(xml_body)
+        # Parse and verify content straight from the file; the parser handles the XML declaration
+        root = parse(output_path).getroot()
         
         # Should have basic sections
         assert root.find("MessageHeader") is not None, "Should have MessageHeader"
@@ -113,14 +98,11 @@ def test_enhanced_inbound_config():
         assert loan_interest is not None, "Should have loan interest information"
         
         # Count lines - should be much more than basic (around 160+ lines)
-        line_count = len(xml_content.strip().split('\n'))
+        with open(output_path, 'r', encoding='utf-8') as f:
+            line_count = sum(1 for _ in f)
         assert line_count >= 150, f"Enhanced config should produce 150+ lines, got {line_count}"
         
         print("✅ Enhanced inbound config test passed")
-        
-    finally:
-        if os.path.exists(output_path):
-            os.unlink(output_path)
 
 
 def test_directory_structure():
@@ -6,18 +6,110 @@ components, ensuring reliability and correctness of the transformation process.
 """
 
 import pytest
+import asyncio
 import os
-import sys
 import json
-import tempfile
-from typing import Dict, Any
-from xml.etree.ElementTree import fromstring
+from datetime import datetime
+from typing import Callable, Dict, Any
+import lxml.etree as ET
 
-# Add src directory to path for imports
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+from hl7_parser import HL7Parser, HL7Message, HL7Segment, HL7Field, HL7ValidationError, OBXRow
+from transformer import BidirectionalTransformer, TransformationError, extract_fields, \
+    PARALLEL_MIN_FILES
 
-from hl7_parser import HL7Parser, HL7Message, HL7Segment, HL7Field
-from transformer import HL7ToXMLTransformer, TransformationError
+# Repository config/ and data/input/ directories, used by the directory-level tests
+_CONFIG_DIR = os.path.join(os.path.dirname(__file__), '..', 'config')
+_INPUT_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'input')
+
+# Sample ADT^A01 message shared by every test class
+_SAMPLE_HL7_BYTES = b"""MSH|^~\\&|EPIC|UCDMC|CERNER|UCDMC|202312151430||ADT^A01^ADT_A01|12345|P|2.5|||AL||||||
+PID|1||123456789^^^UCDMC^MR||DOE^JANE^MARIE^||19850315|F||2106-3^White^HL70005|123 MAIN ST^^SACRAMENTO^CA^95814^USA||(916)555-1234|(916)555-5678|EN^English^HL70296|S^Single^HL70002|CHR^Christian^HL70006|||123-45-6789|||N^Not Hispanic or Latino^HL70189||||||||||202312151430|
+PV1|1|I|ICU^101^A|E|||123456^JOHNSON^ROBERT^M^DR^MD|123456^JOHNSON^ROBERT^M^DR^MD|MED||||19|VIP|||123456^JOHNSON^ROBERT^M^DR^MD|INP|INS|||||||||||||||||||||202312151430|202312151600|1|
+AL1|1||DRUG^Penicillin^L|MO^Moderate^HL70128|Rash|
+DG1|1|I10|Z51.11^Encounter for antineoplastic chemotherapy^ICD10|Encounter for antineoplastic chemotherapy||W|"""
+
+# Sample ADT^A01 mapping configuration; tests must not mutate it
+_SAMPLE_MAPPING_CONFIG: Dict[str, Any] = {
+    "message_type": "ADT^A01",
+    "output_format": "xml",
+    "mappings": {
+        "patient": {
+            "patient_id": {
+                "source": "PID.4.1",
+                "type": "string",
+                "required": True
+            },
+            "last_name": {
+                "source": "PID.6.1",
+                "type": "string",
+                "required": True
+            },
+            "first_name": {
+                "source": "PID.6.2",
+                "type": "string",
+                "required": True
+            },
+            "date_of_birth": {
+                "source": "PID.8",
+                "type": "date",
+                "format": "YYYYMMDD",
+                "required": True
+            }
+        },
+        "message_header": {
+            "sending_application": {
+                "source": "MSH.3",
+                "type": "string",
+                "required": True
+            },
+            "message_type": {
+                "source": "MSH.9.1",
+                "type": "string",
+                "required": True
+            }
+        }
+    }
+}
+
+
+@pytest.fixture(scope="session")
+def sample_hl7_message() -> str:
+    """Fixture providing a sample HL7 message."""
+    return _SAMPLE_HL7_BYTES.decode()
+
+
+@pytest.fixture(scope="session")
+def parsed_message() -> HL7Message:
+    """Fixture providing the sample HL7 message parsed once; tests must only read it."""
+    return HL7Parser.parse(_SAMPLE_HL7_BYTES)
+
+
+@pytest.fixture(scope="session", params=["text", "bytes"])
+def message_parser(request) -> Callable[[bytes], HL7Message]:
+    """Fixture providing each parser entry point as a callable on raw message bytes."""
+    if request.param == "bytes":
+        return HL7Parser.parse
+    return lambda data: HL7Parser.parse(data.decode())
+
+
+@pytest.fixture(scope="session")
+def sample_mapping_config() -> Dict[str, Any]:
+    """Fixture providing a sample mapping configuration."""
+    return _SAMPLE_MAPPING_CONFIG
+
+
+@pytest.fixture(scope="session")
+def sample_mapping_json(sample_mapping_config: Dict[str, Any]) -> str:
+    """Fixture providing the sample mapping configuration serialized once for file writes."""
+    return json.dumps(sample_mapping_config)
+
+
+@pytest.fixture(scope="session")
+def transformer(sample_mapping_json: str, tmp_path_factory) -> BidirectionalTransformer:
+    """Fixture providing one transformer for the whole session; tests must only read it."""
+    config_path = tmp_path_factory.mktemp("config") / "mapping.json"
+    config_path.write_text(sample_mapping_json)
+    return BidirectionalTransformer(str(config_path))
 
 
 class TestHL7Field:
@@ -39,6 +131,17 @@ class TestHL7Field:
         assert field.get_component(4) is None
         assert field.get_component(0) is None
     
+    def test_get_subcomponent(self):
+        """Test getting subcomponents by component and subcomponent index."""
+        field = HL7Field("12345^^^HOSPITAL&1.2.3&ISO^MR")
+        assert field.get_subcomponent(1, 1) == "12345"
+        assert field.get_subcomponent(4, 1) == "HOSPITAL"
+        assert field.get_subcomponent(4, 2) == "1.2.3"
+        assert field.get_subcomponent(4, 3) == "ISO"
+        assert field.get_subcomponent(4, 4) is None
+        assert field.get_subcomponent(5, 1) == "MR"
+        assert field.get_subcomponent(6, 1) is None
+    
     def test_empty_field(self):
         """Test handling of empty fields."""
         field = HL7Field("")
@@ -78,18 +181,9 @@ class TestHL7Segment:
 class TestHL7Message:
     """Test cases for HL7Message class."""
     
-    @pytest.fixture
-    def sample_hl7_message(self) -> str:
-        """Fixture providing a sample HL7 message."""
-        return """MSH|^~\\&|EPIC|UCDMC|CERNER|UCDMC|202312151430||ADT^A01^ADT_A01|12345|P|2.5|||AL||||||
-PID|1||123456789^^^UCDMC^MR||DOE^JANE^MARIE^||19850315|F||2106-3^White^HL70005|123 MAIN ST^^SACRAMENTO^CA^95814^USA||(916)555-1234|(916)555-5678|EN^English^HL70296|S^Single^HL70002|CHR^Christian^HL70006|||123-45-6789|||N^Not Hispanic or Latino^HL70189||||||||||202312151430|
-PV1|1|I|ICU^101^A|E|||123456^JOHNSON^ROBERT^M^DR^MD|123456^JOHNSON^ROBERT^M^DR^MD|MED||||19|VIP|||123456^JOHNSON^ROBERT^M^DR^MD|INP|INS|||||||||||||||||||||202312151430|202312151600|1|
-AL1|1||DRUG^Penicillin^L|MO^Moderate^HL70128|Rash|
-DG1|1|I10|Z51.11^Encounter for antineoplastic chemotherapy^ICD10|Encounter for antineoplastic chemotherapy||W|"""
-    
-    def test_message_parsing(self, sample_hl7_message: str) -> None:
+    def test_message_parsing(self, parsed_message: HL7Message) -> None:
         """Test parsing of complete HL7 message."""
-        message = HL7Message(sample_hl7_message)
+        message = parsed_message
         
         # Check segments are parsed correctly
         assert "MSH" in message.segments
@@ -102,9 +196,9 @@ DG1|1|I10|Z51.11^Encounter for antineoplastic chemotherapy^ICD10|Encounter for a
         assert len(message.segments["PID"]) == 1
         assert len(message.segments["AL1"]) == 1
     
-    def test_get_field_value(self, sample_hl7_message: str) -> None:
+    def test_get_field_value(self, parsed_message: HL7Message) -> None:
         """Test field value extraction using dot notation."""
-        message = HL7Message(sample_hl7_message)
+        message = parsed_message
         
         # Test simple field extraction
         assert message.get_field_value("PID.6.1") == "DOE"
@@ -112,13 +206,17 @@ DG1|1|I10|Z51.11^Encounter for antineoplastic chemotherapy^ICD10|Encounter for a
         assert message.get_field_value("PID.8") == "19850315"
         assert message.get_field_value("PID.9") == "F"
         
+        # Test subcomponent extraction
+        assert message.get_field_value("PID.4.1.1") == "123456789"
+        assert message.get_field_value("PID.4.1.2") is None
+        
         # Test non-existent fields
         assert message.get_field_value("PID.999") is None
         assert message.get_field_value("XXX.1") is None
     
-    def test_get_segments(self, sample_hl7_message: str) -> None:
+    def test_get_segments(self, parsed_message: HL7Message) -> None:
         """Test getting segments by type."""
-        message = HL7Message(sample_hl7_message)
+        message = parsed_message
         
         pid_segments = message.get_segments("PID")
         assert len(pid_segments) == 1
@@ -126,23 +224,137 @@ DG1|1|I10|Z51.11^Encounter for antineoplastic chemotherapy^ICD10|Encounter for a
         
         nonexistent_segments = message.get_segments("OBX")
         assert len(nonexistent_segments) == 0
+    
+    def test_get_segments_columnar(self) -> None:
+        """Test getting repeated segments as field columns."""
+        message = HL7Message("MSH|^~\\&|LAB\nOBX|1|NM|GLU^Glucose||95|mg/dL\nOBX|2|NM|NA^Sodium||140")
+        
+        columns = message.get_segments_columnar("OBX")
+        assert columns[1] == ["1", "2"]
+        assert columns[3] == ["GLU^Glucose", "NA^Sodium"]
+        assert columns[6] == ["mg/dL", ""]
+        assert message.get_segments_columnar("PID") == {}
+    
+    def test_wanted_segments(self, sample_hl7_message: str) -> None:
+        """Test that segment types outside the wanted set are skipped."""
+        message = HL7Message(sample_hl7_message, wanted={"PID"})
+        
+        assert "MSH" in message.segments  # MSH is always kept
+        assert "PID" in message.segments
+        assert "PV1" not in message.segments
+        assert "AL1" not in message.segments
+        assert message.get_field_value("PID.6.1") == "DOE"
 
 
 class TestHL7Parser:
     """Test cases for HL7Parser class."""
     
-    @pytest.fixture
-    def sample_hl7_message(self) -> str:
-        """Fixture providing a sample HL7 message."""
-        return """MSH|^~\\&|EPIC|UCDMC|CERNER|UCDMC|202312151430||ADT^A01^ADT_A01|12345|P|2.5|||AL||||||
-PID|1||123456789^^^UCDMC^MR||DOE^JANE^MARIE^||19850315|F||2106-3^White^HL70005|123 MAIN ST^^SACRAMENTO^CA^95814^USA||(916)555-1234|(916)555-5678|EN^English^HL70296|S^Single^HL70002|CHR^Christian^HL70006|||123-45-6789|||N^Not Hispanic or Latino^HL70189||||||||||202312151430|"""
-    
-    def test_parse_message(self, sample_hl7_message: str) -> None:
-        """Test parsing HL7 message from string."""
-        message = HL7Parser.parse(sample_hl7_message)
+    def test_parse_message(self, message_parser: Callable[[bytes], HL7Message]) -> None:
+        """Test parsing HL7 message through the text and byte-level parsers."""
+        message = message_parser(_SAMPLE_HL7_BYTES)
         assert isinstance(message, HL7Message)
         assert "MSH" in message.segments
         assert "PID" in message.segments
+        assert {segment_type: len(segments) for segment_type, segments in message.segments.items()} == \
+            {"MSH": 1, "PID": 1, "PV1": 1, "AL1": 1, "DG1": 1}
+        assert message.get_field_value("PID.6.1") == "DOE"
+        assert message.get_field_value("AL1.4.2") == "Penicillin"
+    
+    def test_parse_keeps_unicode_line_breaks_in_fields(self, message_parser: Callable[[bytes], HL7Message]) -> None:
+        """Test that only CR and LF end segments; other line-break characters stay in field values."""
+        data = "MSH|^~\\&|LAB\rPID|1||1||DOE\x85X^JANE\rOBX|1|TX|NOTE||line1\u2028line2\x0bline3".encode("utf-8")
+        message = message_parser(data)
+        
+        assert sorted(message.segments) == ["MSH", "OBX", "PID"]
+        assert message.get_field_value("PID.6.2") == "JANE"
+        assert message.get_field_value("OBX.6") == "line1\u2028line2\x0bline3"
+    
+    def test_parse_strips_surrounding_whitespace(self, message_parser: Callable[[bytes], HL7Message]) -> None:
+        """Test that indented lines and trailing blanks do not leak into segment types or values."""
+        data = b"MSH|^~\\&|LAB\r  PID|1||1||DOE^JANE\rOBX|1|TS|DATE||202312151430 \r"
+        message = message_parser(data)
+        
+        assert sorted(message.segments) == ["MSH", "OBX", "PID"]
+        assert message.get_field_value("PID.6.1") == "DOE"
+        assert message.get_field_value("OBX.6") == "202312151430"
+        assert HL7Parser.parse_from_bytes(data, wanted={"PID"}).get_field_value("PID.6.1") == "DOE"
+        assert HL7Message(data.decode(), wanted={"PID"}).get_field_value("PID.6.1") == "DOE"
+        assert HL7Parser.parse_oru_obx(data.decode())[0].value == "202312151430"
+    
+    def test_parse_lazy(self, sample_hl7_message: str) -> None:
+        """Test that lazily parsed segments are built on first access."""
+        message = HL7Parser.parse_lazy(sample_hl7_message)
+        
+        assert "MSH" in message.segments
+        assert "PID" not in message.segments
+        assert message.get_field_value("PID.6.1") == "DOE"
+        assert "PID" in message.segments
+        assert message.get_segments("PID") is message.get_segments("PID")
+        assert message.get_segments("OBX") == []
+    
+    def test_parse_lazy_after_segments_index(self, sample_hl7_message: str) -> None:
+        """Test that indexing segments before get_segments() does not hide pending lines."""
+        message = HL7Parser.parse_lazy(sample_hl7_message)
+        
+        pid_segments = message.segments["PID"]
+        assert pid_segments == []
+        assert message.get_field_value("PID.6.1") == "DOE"
+        assert len(pid_segments) == 1
+    
+    def test_parse_from_bytes(self, sample_hl7_message: str) -> None:
+        """Test parsing HL7 message from raw bytes with CR segment terminators."""
+        data = sample_hl7_message.replace("\n", "\r").encode("utf-8")
+        message = HL7Parser.parse_from_bytes(data)
+        assert "MSH" in message.segments
+        assert message.get_field_value("PID.6.1") == "DOE"
+        assert message.message_text is None
+        assert HL7Parser.parse(sample_hl7_message).message_text == sample_hl7_message
+        
+        view_message = HL7Parser.parse_from_bytes(memoryview(data))
+        assert view_message.get_field_value("PID.6.1") == "DOE"
+        
+        filtered = HL7Parser.parse_from_bytes(data, wanted={"PID"})
+        assert sorted(filtered.segments) == ["MSH", "PID"]
+        assert filtered.get_field_value("PID.6.1") == "DOE"
+    
+    def test_parse_from_file_cache(self, sample_hl7_message: str, tmp_path) -> None:
+        """Test that unchanged files are served from the parse cache."""
+        hl7_path = tmp_path / "message.hl7"
+        hl7_path.write_text(sample_hl7_message)
+        HL7Parser.clear_cache()
+        
+        first = HL7Parser.parse_from_file(str(hl7_path))
+        assert HL7Parser.parse_from_file(str(hl7_path)) is first
+        assert HL7Parser.parse_from_file(str(hl7_path), wanted={"PID"}) is first
+        
+        hl7_path.write_text(sample_hl7_message + "\nOBX|1|NM|GLU^Glucose||95")
+        reparsed = HL7Parser.parse_from_file(str(hl7_path))
+        assert reparsed is not first
+        assert "OBX" in reparsed.segments
+    
+    def test_parse_many_async(self, sample_hl7_message: str, tmp_path) -> None:
+        """Test concurrent parsing of several files."""
+        paths = []
+        for index in range(3):
+            hl7_path = tmp_path / f"message_{index}.hl7"
+            hl7_path.write_text(sample_hl7_message.replace("DOE", f"DOE{index}"))
+            paths.append(str(hl7_path))
+        
+        messages = asyncio.run(HL7Parser.parse_many_async(paths))
+        assert [m.get_field_value("PID.6.1") for m in messages] == ["DOE0", "DOE1", "DOE2"]
+    
+    def test_parse_oru_obx(self) -> None:
+        """Test the OBX fast path for lab result messages."""
+        oru_message = """MSH|^~\\&|LAB|UCDMC|EMR|UCDMC|202312151430||ORU^R01|67890|P|2.5
+PID|1||123456789^^^UCDMC^MR||DOE^JANE
+OBX|1|NM|GLU^Glucose^LN||250|mg/dL|70-99|H
+OBX|2|NM|NA^Sodium^LN||140|mmol/L|135-145|"""
+        
+        rows = HL7Parser.parse_oru_obx(oru_message)
+        assert len(rows) == 2
+        assert rows[0] == OBXRow(set_id=1, identifier="GLU", name="Glucose", value="250", units="mg/dL", flags="H")
+        assert rows[1].identifier == "NA"
+        assert rows[1].flags == ""
     
     def test_format_date(self):
         """Test date formatting functionality."""
@@ -158,194 +370,178 @@ PID|1||123456789^^^UCDMC^MR||DOE^JANE^MARIE^||19850315|F||2106-3^White^HL70005|1
         # Test empty date
         assert HL7Parser.format_date("", "YYYYMMDD") is None
     
-    def test_validate_message(self, sample_hl7_message: str) -> None:
+    def test_format_dates(self):
+        """Test batch date formatting."""
+        dates = ["19850315", "20231215", "invalid", ""]
+        assert HL7Parser.format_dates(dates, "YYYYMMDD") == ["1985-03-15", "2023-12-15", "invalid", None]
+    
+    def test_validate_message(self, parsed_message: HL7Message) -> None:
         """Test message validation."""
-        message = HL7Parser.parse(sample_hl7_message)
-        errors = HL7Parser.validate_message(message)
+        errors = HL7Parser.validate_message(parsed_message)
         assert len(errors) == 0  # Should be valid
         
         # Test message without MSH
         invalid_message = HL7Message("PID|1||123456789")
         errors = HL7Parser.validate_message(invalid_message)
-        assert "Missing required MSH segment" in errors
+        assert HL7ValidationError.MISSING_MSH in errors
+        assert str(HL7ValidationError.MISSING_MSH) == "Missing required MSH segment"
 
 
-class TestHL7ToXMLTransformer:
-    """Test cases for HL7ToXMLTransformer class."""
+class TestBidirectionalTransformer:
+    """Test cases for BidirectionalTransformer class."""
     
-    @pytest.fixture
-    def sample_mapping_config(self) -> Dict[str, Any]:
-        """Fixture providing a sample mapping configuration."""
-        return {
-            "message_type": "ADT^A01",
-            "output_format": "xml",
-            "mappings": {
-                "patient": {
-                    "patient_id": {
-                        "source": "PID.4.1",
-                        "type": "string",
-                        "required": True
-                    },
-                    "last_name": {
-                        "source": "PID.6.1",
-                        "type": "string",
-                        "required": True
-                    },
-                    "first_name": {
-                        "source": "PID.6.2",
-                        "type": "string",
-                        "required": True
-                    },
-                    "date_of_birth": {
-                        "source": "PID.8",
-                        "type": "date",
-                        "format": "YYYYMMDD",
-                        "required": True
-                    }
-                },
-                "message_header": {
-                    "sending_application": {
-                        "source": "MSH.3",
-                        "type": "string",
-                        "required": True
-                    },
-                    "message_type": {
-                        "source": "MSH.9.1",
-                        "type": "string",
-                        "required": True
-                    }
-                }
-            }
-        }
-    
-    @pytest.fixture
-    def sample_hl7_message(self) -> str:
-        """Fixture providing a sample HL7 message."""
-        return """MSH|^~\\&|EPIC|UCDMC|CERNER|UCDMC|202312151430||ADT^A01^ADT_A01|12345|P|2.5|||AL||||||
-PID|1||123456789^^^UCDMC^MR||DOE^JANE^MARIE^||19850315|F||2106-3^White^HL70005|123 MAIN ST^^SACRAMENTO^CA^95814^USA||(916)555-1234|(916)555-5678|EN^English^HL70296|S^Single^HL70002|CHR^Christian^HL70006|||123-45-6789|||N^Not Hispanic or Latino^HL70189||||||||||202312151430|"""
-    
-    def test_transformer_initialization(self, sample_mapping_config: Dict[str, Any]) -> None:
+    def test_transformer_initialization(self, transformer: BidirectionalTransformer, sample_mapping_config: Dict[str, Any]) -> None:
         """Test transformer initialization with config."""
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
-            json.dump(sample_mapping_config, f)
-            config_path = f.name
-        
-        try:
-            transformer = HL7ToXMLTransformer(config_path)
-            assert transformer.mapping_config == sample_mapping_config
-            assert "patient" in transformer.mappings
-            assert "message_header" in transformer.mappings
-        finally:
-            os.unlink(config_path)
+        assert transformer.mapping_config == sample_mapping_config
+        assert "patient" in transformer.mappings
+        assert "message_header" in transformer.mappings
+    
+    def test_transformer_config_cache(self, sample_mapping_json: str, tmp_path) -> None:
+        """Test that transformers share the parsed config until the file changes."""
+        config_path = tmp_path / "mapping.json"
+        config_path.write_text(sample_mapping_json)
+        
+        first = BidirectionalTransformer(str(config_path))
+        assert BidirectionalTransformer(str(config_path)).mapping_config is first.mapping_config
+        
+        # A rewrite that keeps the old modification time, as within coarse timestamp granularity
+        mtime_ns = config_path.stat().st_mtime_ns
+        config_path.write_text(json.dumps({"mappings": {}}))
+        os.utime(config_path, ns=(mtime_ns, mtime_ns))
+        assert BidirectionalTransformer(str(config_path)).mapping_config == {"mappings": {}}
     
     def test_transformer_invalid_config(self):
         """Test transformer with invalid configuration file."""
         with pytest.raises(TransformationError):
-            HL7ToXMLTransformer("nonexistent_file.json")
+            BidirectionalTransformer("nonexistent_file.json")
+    
+    def test_transform_restamps_each_call(self, sample_mapping_json: str, parsed_message: HL7Message,
+                                          tmp_path) -> None:
+        """Test that single-file transforms are stamped with the call time, not construction time."""
+        config_path = tmp_path / "mapping.json"
+        config_path.write_text(sample_mapping_json)
+        hl7_path = tmp_path / "message.hl7"
+        hl7_path.write_bytes(_SAMPLE_HL7_BYTES)
+        transformer = BidirectionalTransformer(str(config_path), verbose=False)
+        stale = datetime(2000, 1, 1)
+        
+        transformer._start_run(stale)  # type: ignore[misc]
+        assert transformer.transform(parsed_message).get("timestamp") != stale.isoformat()
+        
+        transformer._start_run(stale)  # type: ignore[misc]
+        transformer.transform_file(str(hl7_path), str(tmp_path / "out.xml"))
+        assert ET.parse(str(tmp_path / "out.xml")).getroot().get("timestamp") != stale.isoformat()
     
-    def test_transform_to_xml(self, sample_mapping_config: Dict[str, Any], sample_hl7_message: str) -> None:
+    def test_transform_to_xml(self, transformer: BidirectionalTransformer, parsed_message: HL7Message) -> None:
         """Test transformation of HL7 message to XML."""
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
-            json.dump(sample_mapping_config, f)
-            config_path = f.name
-        
-        try:
-            transformer = HL7ToXMLTransformer(config_path)
-            hl7_message = HL7Parser.parse(sample_hl7_message)
-            
-            xml_element = transformer.transform(hl7_message)
-            
-            # Check root element
-            assert xml_element.tag == "HealthcareMessage"
-            assert xml_element.get("version") == "1.0"
-            assert xml_element.get("timestamp") is not None
-            
-            # Convert to string and parse back to verify structure
-            xml_string = transformer.transform_to_xml_string(hl7_message)
-            assert "<HealthcareMessage" in xml_string
-            assert "<Patient>" in xml_string
-            assert "<MessageHeader>" in xml_string
-            
-            # Parse XML to verify content
-            root = fromstring(xml_string.split('?>')[1])  # Remove XML declaration
-            
-            # Find patient section
-            patient = root.find("Patient")
-            assert patient is not None
-            
-            # Check patient fields
-            patient_id = patient.find("PatientId")
-            assert patient_id is not None
-            assert patient_id.text == "123456789"
-            
-            last_name = patient.find("LastName")
-            assert last_name is not None
-            assert last_name.text == "DOE"
-            
-            first_name = patient.find("FirstName")
-            assert first_name is not None
-            assert first_name.text == "JANE"
-            
-        finally:
-            os.unlink(config_path)
-    
-    def test_camel_case_conversion(self, sample_mapping_config: Dict[str, Any]) -> None:
+        hl7_message = parsed_message
+        
+        xml_element = transformer.transform(hl7_message)
+        
+        # Check root element
+        assert xml_element.tag == "HealthcareMessage"
+        assert xml_element.get("version") == "1.0"
+        assert xml_element.get("timestamp") is not None
+        
+        # Check sections on the returned tree; no serialize and re-parse round trip
+        assert xml_element.find("MessageHeader") is not None
+        assert xml_element.find("Patient") is not None
+        
+        # Check patient fields
+        expected_patient = {"PatientId": "123456789", "LastName": "DOE", "FirstName": "JANE"}
+        for tag, value in expected_patient.items():
+            assert xml_element.findtext(f"Patient/{tag}") == value, tag
+    
+    @pytest.mark.parametrize("snake,expected", [
+        ("patient_id", "PatientId"),
+        ("last_name", "LastName"),
+        ("message_header", "MessageHeader"),
+        ("simple", "Simple"),
+    ])
+    def test_camel_case_conversion(self, transformer: BidirectionalTransformer, snake: str, expected: str) -> None:
         """Test snake_case to CamelCase conversion."""
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
-            json.dump(sample_mapping_config, f)
-            config_path = f.name
-        
-        try:
-            transformer = HL7ToXMLTransformer(config_path)
-            
-            assert transformer._camel_case("patient_id") == "PatientId"  # type: ignore[misc]
-            assert transformer._camel_case("last_name") == "LastName"  # type: ignore[misc]
-            assert transformer._camel_case("message_header") == "MessageHeader"  # type: ignore[misc]
-            assert transformer._camel_case("simple") == "Simple"  # type: ignore[misc]
-            
-        finally:
-            os.unlink(config_path)
-    
-    def test_field_extraction(self, sample_mapping_config: Dict[str, Any], sample_hl7_message: str) -> None:
+        assert transformer._camel_case(snake) == expected  # type: ignore[misc]
+    
+    def test_field_extraction(self, transformer: BidirectionalTransformer, parsed_message: HL7Message) -> None:
         """Test field value extraction with different types."""
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
-            json.dump(sample_mapping_config, f)
-            config_path = f.name
-        
-        try:
-            transformer = HL7ToXMLTransformer(config_path)
-            hl7_message = HL7Parser.parse(sample_hl7_message)
-            
-            # Test string field
-            field_config = {"source": "PID.6.1", "type": "string"}
-            value = transformer._extract_field_value(hl7_message, field_config)  # type: ignore[misc]
-            assert value == "DOE"
-            
-            # Test date field
-            field_config = {"source": "PID.8", "type": "date", "format": "YYYYMMDD"}
-            value = transformer._extract_field_value(hl7_message, field_config)  # type: ignore[misc]
-            assert value == "1985-03-15"
-            
-            # Test non-existent field
-            field_config = {"source": "PID.999", "type": "string"}
-            value = transformer._extract_field_value(hl7_message, field_config)  # type: ignore[misc]
-            assert value is None
-            
-        finally:
-            os.unlink(config_path)
+        hl7_message = parsed_message
+        
+        # Test string field
+        field_config = {"source": "PID.6.1", "type": "string"}
+        value = transformer._extract_field_value(hl7_message, field_config)  # type: ignore[misc]
+        assert value == "DOE"
+        
+        # Test date field
+        field_config = {"source": "PID.8", "type": "date", "format": "YYYYMMDD"}
+        value = transformer._extract_field_value(hl7_message, field_config)  # type: ignore[misc]
+        assert value == "1985-03-15"
+        
+        # Test non-existent field
+        field_config = {"source": "PID.999", "type": "string"}
+        value = transformer._extract_field_value(hl7_message, field_config)  # type: ignore[misc]
+        assert value is None
+    
+    def test_verbose_logging(self, sample_mapping_json: str, sample_hl7_message: str,
+                             tmp_path, capsys) -> None:
+        """Test that progress lines are written on flush and silenced without verbose."""
+        config_path = tmp_path / "config.json"
+        config_path.write_text(sample_mapping_json)
+        hl7_path = tmp_path / "message.hl7"
+        hl7_path.write_text(sample_hl7_message)
+        
+        BidirectionalTransformer(str(config_path)).transform_file(str(hl7_path), str(tmp_path / "out.xml"))
+        assert capsys.readouterr().out == "✓ Transformed: message.hl7 → out.xml\n"
+        
+        quiet = BidirectionalTransformer(str(config_path), verbose=False)
+        quiet.transform_file(str(hl7_path), str(tmp_path / "quiet.xml"))
+        assert capsys.readouterr().out == ""
+    
+    def test_xml_template_matches_element_tree(self, transformer: BidirectionalTransformer, sample_hl7_message: str,
+                                               tmp_path, monkeypatch) -> None:
+        """Test the string-join template writes the same file as the Element tree path."""
+        input_path = tmp_path / "input.hl7"
+        input_path.write_text(sample_hl7_message.replace("DOE^JANE", "DOE & <SONS>^JANE"))
+        
+        assert transformer._xml_template is not None  # type: ignore[misc]
+        transformer._transform_hl7_to_xml(str(input_path), str(tmp_path / "template.xml"))  # type: ignore[misc]
+        monkeypatch.setattr(transformer, "_xml_template", None)
+        transformer._transform_hl7_to_xml(str(input_path), str(tmp_path / "tree.xml"))  # type: ignore[misc]
+        monkeypatch.undo()
+        assert (tmp_path / "template.xml").read_bytes() == (tmp_path / "tree.xml").read_bytes()
+        
+        # Values lxml refuses are refused by the template writer too
+        bad_message = HL7Parser.parse(sample_hl7_message.replace("DOE^JANE", "DOE\ufffe^JANE"))
+        with pytest.raises(ValueError):
+            transformer._hl7_to_xml_element(bad_message)  # type: ignore[misc]
+        with pytest.raises(ValueError):
+            transformer._render_xml_template(bad_message)  # type: ignore[misc]
+    
+    def test_xml_template_skips_invalid_tags(self, tmp_path) -> None:
+        """Test that field names lxml rejects as tags fall back to the Element tree path."""
+        config_path = tmp_path / "mapping.json"
+        config_path.write_text(json.dumps({"mappings": {"patient": {"2nd_phone": {"source": "PID.14"}}}}))
+        
+        transformer = BidirectionalTransformer(str(config_path))
+        assert transformer._xml_template is None  # type: ignore[misc]
+        with pytest.raises(ValueError, match="Invalid tag name"):
+            transformer._hl7_to_xml_element(HL7Parser.parse(_SAMPLE_HL7_BYTES))  # type: ignore[misc]
+    
+    def test_extract_fields(self) -> None:
+        """Test per-segment extraction of pre-parsed field sources."""
+        segment_fields = "AL1|1||DRUG^Penicillin^L|MO^Moderate^HL70128|Rash|".split('|')
+        section_fields = [("SetId", 2, 1), ("Code", 4, 1), ("Name", 4, 2), ("Type", 4, 9),
+                          ("Reaction", 6, 1), ("Missing", 99, 1)]
+        
+        assert extract_fields(segment_fields, section_fields) == [
+            ("SetId", "1"), ("Code", "DRUG^Penicillin^L"), ("Name", "Penicillin"), ("Reaction", "Rash")
+        ]
 
 
 class TestIntegration:
     """Integration tests for the complete transformation process."""
     
-    def test_end_to_end_transformation(self) -> None:
+    def test_end_to_end_transformation(self, tmp_path) -> None:
         """Test complete end-to-end transformation process."""
-        # Create sample HL7 message
-        hl7_content = """MSH|^~\\&|EPIC|UCDMC|CERNER|UCDMC|202312151430||ADT^A01^ADT_A01|12345|P|2.5|||AL||||||
-PID|1||123456789^^^UCDMC^MR||DOE^JANE^MARIE^||19850315|F||2106-3^White^HL70005|123 MAIN ST^^SACRAMENTO^CA^95814^USA||(916)555-1234|(916)555-5678|EN^English^HL70296|S^Single^HL70002|CHR^Christian^HL70006|||123-45-6789|||N^Not Hispanic or Latino^HL70189||||||||||202312151430|
-PV1|1|I|ICU^101^A|E|||123456^JOHNSON^ROBERT^M^DR^MD|123456^JOHNSON^ROBERT^M^DR^MD|MED||||19|VIP|||123456^JOHNSON^ROBERT^M^DR^MD|INP|INS|||||||||||||||||||||202312151430|202312151600|1|
-AL1|1||DRUG^Penicillin^L|MO^Moderate^HL70128|Rash|"""
-        
         # Create mapping configuration
         mapping_config = {
             "message_type": "ADT^A01",
@@ -368,44 +564,76 @@ AL1|1||DRUG^Penicillin^L|MO^Moderate^HL70128|Rash|"""
             }
         }
         
-        # Create temporary files
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.hl7', delete=False) as hl7_file:
-            hl7_file.write(hl7_content)
-            hl7_path = hl7_file.name
-        
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as config_file:
-            json.dump(mapping_config, config_file)
-            config_path = config_file.name
-        
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.xml', delete=False) as xml_file:
-            xml_path = xml_file.name
-        
-        try:
-            # Perform transformation
-            transformer = HL7ToXMLTransformer(config_path)
-            transformer.transform_file(hl7_path, xml_path)
-            
-            # Verify output file exists and contains expected content
-            assert os.path.exists(xml_path)
-            
-            with open(xml_path, 'r', encoding='utf-8') as f:
-                xml_content = f.read()
-            
-            # Verify XML structure
-            assert "<HealthcareMessage" in xml_content
-            assert "<Patient>" in xml_content
-            assert "<PatientId>123456789</PatientId>" in xml_content
-            assert "<LastName>DOE</LastName>" in xml_content
-            assert "<FirstName>JANE</FirstName>" in xml_content
-            assert "<DateOfBirth>1985-03-15</DateOfBirth>" in xml_content
-            assert "<Allergies>" in xml_content
-            assert "<Severity>Penicillin</Severity>" in xml_content
-            
-        finally:
-            # Clean up temporary files
-            for temp_file in [hl7_path, config_path, xml_path]:
-                if os.path.exists(temp_file):
-                    os.unlink(temp_file)
+        # Create input files in the per-test directory; pytest removes it
+        hl7_path = tmp_path / "message.hl7"
+        hl7_path.write_bytes(_SAMPLE_HL7_BYTES)
+        config_path = tmp_path / "mapping.json"
+        config_path.write_text(json.dumps(mapping_config))
+        xml_path = tmp_path / "out.xml"
+        
+        # Perform transformation
+        transformer = BidirectionalTransformer(str(config_path))
+        transformer.transform_file(str(hl7_path), str(xml_path))
+        
+        # Verify output file exists and contains expected content
+        assert xml_path.exists()
+        
+        # Verify XML structure in one streaming pass; elements are freed once checked
+        expected_text = {
+            "PatientId": "123456789",
+            "LastName": "DOE",
+            "FirstName": "JANE",
+            "DateOfBirth": "1985-03-15",
+            "Severity": "Penicillin",
+        }
+        found_text: Dict[str, str] = {}
+        found_tags = set()
+        for _, elem in ET.iterparse(str(xml_path), events=("end",)):
+            found_tags.add(elem.tag)
+            if elem.tag in expected_text:
+                found_text[elem.tag] = elem.text
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+        
+        assert elem.tag == "HealthcareMessage"  # the root is the last element to end
+        assert {"Patient", "Allergies"} <= found_tags
+        assert found_text == expected_text
+    
+    def test_process_directory_parallel(self, tmp_path) -> None:
+        """Test process pool directory runs in both directions, skipping hidden files."""
+        with open(os.path.join(_INPUT_DIR, 'xml', 'sample_patient_data.xml'), 'rb') as file:
+            sample_xml_bytes = file.read()
+        input_dir = tmp_path / "input"
+        (input_dir / "hl7").mkdir(parents=True)
+        (input_dir / "xml").mkdir()
+        for i in range(PARALLEL_MIN_FILES):
+            (input_dir / "hl7" / f"message_{i}.hl7").write_bytes(_SAMPLE_HL7_BYTES)
+            (input_dir / "xml" / f"patient_{i}.xml").write_bytes(sample_xml_bytes)
+        (input_dir / "hl7" / ".hidden.hl7").write_bytes(_SAMPLE_HL7_BYTES)
+        (input_dir / "xml" / ".hidden.xml").write_bytes(sample_xml_bytes)
+        output_dir = tmp_path / "output"
+        
+        inbound = BidirectionalTransformer(os.path.join(_CONFIG_DIR, 'inbound_config.json'), verbose=False)
+        xml_written = inbound.process_directory(str(input_dir), str(output_dir))
+        outbound = BidirectionalTransformer(os.path.join(_CONFIG_DIR, 'outbound_config.json'), verbose=False)
+        hl7_written = outbound.process_directory(str(input_dir), str(output_dir))
+        
+        assert sorted(os.listdir(output_dir / "xml_output")) == [f"message_{i}.xml" for i in range(PARALLEL_MIN_FILES)]
+        assert sorted(os.listdir(output_dir / "hl7_output")) == [f"patient_{i}.hl7" for i in range(PARALLEL_MIN_FILES)]
+        assert len(xml_written) == len(hl7_written) == PARALLEL_MIN_FILES
+        for path in xml_written:
+            assert ET.parse(path).getroot().tag == "HealthcareMessage"
+        
+        control_ids = {HL7Parser.parse_from_file(path).get_field_value("MSH.10") for path in hl7_written}
+        assert len(control_ids) == PARALLEL_MIN_FILES
+        
+        inbound_summary = inbound.get_transformation_summary(str(output_dir))
+        assert (inbound_summary['files_processed'], inbound_summary['xml_files'], inbound_summary['hl7_files']) == \
+            (PARALLEL_MIN_FILES, PARALLEL_MIN_FILES, 0)
+        outbound_summary = outbound.get_transformation_summary(str(output_dir))
+        assert (outbound_summary['files_processed'], outbound_summary['xml_files'], outbound_summary['hl7_files']) == \
+            (PARALLEL_MIN_FILES, 0, PARALLEL_MIN_FILES)
 
 
 if __name__ == "__main__":